@@ -0,0 +1,61 @@
+"""Creation of users one at a time against bulk_create_users.
+
+Users are created with create_user, which hashes and saves each password in
+turn, then with UserEmailManager.bulk_create_users, which hashes passwords
+in a pool of one process per core and inserts them in batches. The number
+of users defaults to 200 and can be passed as the first argument.
+"""
+
+import os
+import sys
+import time
+
+import setup_django
+
+setup_django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.test import override_settings  # noqa: E402
+
+USERS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+User = get_user_model()
+
+
+def users(prefix):
+    for i in range(USERS):
+        yield {
+            'email': '%s%d@email.com' % (prefix, i),
+            'password': 'password%d' % i,
+        }
+
+
+def serial():
+    for fields in users('serial'):
+        User.objects.create_user(**fields)
+
+
+def parallel():
+    User.objects.bulk_create_users(users('bulk'))
+
+
+def main():
+    hashers = ['django.contrib.auth.hashers.PBKDF2PasswordHasher']
+    print('%d users, %d cores' % (USERS, os.cpu_count() or 1))
+    with override_settings(PASSWORD_HASHERS=hashers):
+        for name, create in (
+            ('create_user', serial),
+            ('bulk_create_users', parallel),
+        ):
+            start = time.perf_counter()
+            create()
+            elapsed = time.perf_counter() - start
+            print('%-18s %8.2f s %10.1f users/sec' % (
+                name,
+                elapsed,
+                USERS / elapsed,
+            ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Queries and latency of sign ins spraying unknown emails.
+
+Wrong passwords are posted to AuthSignInView for registered and random
+emails, without and with the email bloom filter. Unknown emails should
+cost no query with the filter, and about as long as known ones.
+"""
+
+import statistics
+import time
+import uuid
+
+import setup_django
+
+setup_django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.contrib.auth.hashers import make_password  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+from rest_framework.test import APIRequestFactory  # noqa: E402
+
+from jasonpi import views  # noqa: E402
+
+USERS = 5000
+ATTEMPTS = 50
+
+User = get_user_model()
+factory = APIRequestFactory()
+signin = views.AuthSignInView.as_view()
+
+
+def attempt(email):
+    request = factory.post(
+        '/auth/signin',
+        {'email': email, 'password': 'wrong'},
+        format='json',
+    )
+    start = time.perf_counter()
+    signin(request)
+    return time.perf_counter() - start
+
+
+def run(emails):
+    with CaptureQueriesContext(connection) as queries:
+        latencies = [attempt(email) for email in emails]
+    return len(queries) / len(emails), latencies
+
+
+def main():
+    hashers = ['django.contrib.auth.hashers.PBKDF2PasswordHasher']
+    with override_settings(PASSWORD_HASHERS=hashers):
+        password = make_password('password')
+        User.objects.bulk_create([
+            User(email='user%d@email.com' % i, password=password)
+            for i in range(USERS)
+        ])
+        known = ['user%d@email.com' % i for i in range(ATTEMPTS)]
+        unknown = ['%s@email.com' % uuid.uuid4() for _ in range(ATTEMPTS)]
+        for enabled in (False, True):
+            with override_settings(JASONPI_EMAIL_FILTER=enabled):
+                attempt(known[0])
+                for label, emails in (('known', known), ('unknown', unknown)):
+                    queries, latencies = run(emails)
+                    print(
+                        'filter=%-5s %-7s queries/request=%.2f '
+                        'mean=%.3f ms stdev=%.3f ms' % (
+                            enabled,
+                            label,
+                            queries,
+                            statistics.mean(latencies) * 1000,
+                            statistics.stdev(latencies) * 1000,
+                        )
+                    )
+
+
+if __name__ == '__main__':
+    main()
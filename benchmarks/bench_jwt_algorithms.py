@@ -0,0 +1,86 @@
+"""Sign and verify throughput of the jwt algorithms supported by the keyring.
+
+Keys are parsed once by the keyring; the last column shows verification
+when the public key is parsed from PEM on each call instead.
+"""
+
+import timeit
+
+import setup_django
+
+setup_django.setup()
+
+from cryptography.hazmat.primitives import serialization  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import \
+    ec, ed25519, rsa  # noqa: E402
+
+import jwt  # noqa: E402
+
+from jasonpi.keys import Key, Keyring  # noqa: E402
+
+DURATION = 0.5
+
+PAYLOAD = {'user_id': 42, 'exp': 4102444800}
+
+
+def pem(private_key):
+    return private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+
+
+def public_pem(private_key):
+    return private_key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo,
+    )
+
+
+def ops_per_second(function):
+    number = 1
+    while True:
+        seconds = timeit.timeit(function, number=number)
+        if seconds > DURATION:
+            return number / seconds
+        number *= 2
+
+
+def main():
+    keys = {
+        'HS256': None,
+        'RS256': rsa.generate_private_key(
+            public_exponent=65537, key_size=2048),
+        'ES256': ec.generate_private_key(ec.SECP256R1()),
+        'EdDSA': ed25519.Ed25519PrivateKey.generate(),
+    }
+    print('%-6s %12s %12s %20s' % (
+        'alg', 'sign/s', 'verify/s', 'verify+parse/s'))
+    for algorithm, private_key in keys.items():
+        if private_key is None:
+            secret = 'a-secret-long-enough-for-an-hs256-signature'
+            key = Key(algorithm, kid='bench', secret=secret)
+            parsed_key = secret
+        else:
+            key = Key(algorithm, kid='bench', private_key=pem(private_key))
+            parsed_key = public_pem(private_key)
+        keyring = Keyring([key])
+        token = keyring.sign(PAYLOAD)
+
+        def parse_and_verify():
+            verifying_key = parsed_key
+            if private_key is not None:
+                verifying_key = serialization.load_pem_public_key(parsed_key)
+            jwt.decode(token, verifying_key, algorithms=[algorithm])
+
+        print('%-6s %12.0f %12.0f %20.0f' % (
+            algorithm,
+            ops_per_second(lambda: keyring.sign(PAYLOAD)),
+            ops_per_second(lambda: keyring.verify(token)),
+            ops_per_second(parse_and_verify),
+        ))
+
+
+if __name__ == '__main__':
+    main()
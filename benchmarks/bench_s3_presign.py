@@ -0,0 +1,77 @@
+"""Throughput of the S3 presign view with a new client per request and
+with the shared client of jasonpi.s3.
+
+Presigning is done offline by botocore with dummy credentials, no request
+reaches S3. The previous view also compiled the key regex per request.
+"""
+
+import os
+import re
+import time
+
+import setup_django
+
+setup_django.setup()
+
+import boto3  # noqa: E402
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from rest_framework.test import \
+    APIRequestFactory, \
+    force_authenticate  # noqa: E402
+
+from jasonpi import s3  # noqa: E402
+from jasonpi.views import s3_get_presigned_url, s3_key_getter  # noqa: E402
+
+REQUESTS = 200
+
+factory = APIRequestFactory()
+
+
+def legacy_presign(request):
+    """Presign like the view did before jasonpi.s3."""
+    client = boto3.client('s3')
+    key = s3_key_getter(request, 'png')
+    regex = re.compile(
+        r'u?%d/(assets|misc)/[0-9]{4}-[0-9]{2}-[0-9]{2}_[0-9a-z-]+\.[^\.]+' %
+        request.user.id,
+    )
+    assert regex.match(key)
+    return client.generate_presigned_url(
+        'put_object',
+        Params={'Bucket': 'bucket', 'Key': key, 'ACL': 'public-read'},
+        ExpiresIn=3600,
+    )
+
+
+def view_presign(request):
+    return s3_get_presigned_url(request).data['signedUrl']
+
+
+def main():
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    user = get_user_model().objects.create_user('bench@email.com')
+    with override_settings(BUCKET='bucket'):
+        for name, presign in (
+            ('client per request', legacy_presign),
+            ('shared client', view_presign),
+        ):
+            s3.reset_client()
+            start = time.perf_counter()
+            for _ in range(REQUESTS):
+                request = factory.get('/auth/s3', {'objectName': 'a.png'})
+                force_authenticate(request, user)
+                request.user = user
+                presign(request)
+            elapsed = time.perf_counter() - start
+            print('%-20s %8.2f ms/request %10.1f requests/sec' % (
+                name,
+                elapsed / REQUESTS * 1000,
+                REQUESTS / elapsed,
+            ))
+
+
+if __name__ == '__main__':
+    main()
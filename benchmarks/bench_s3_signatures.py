@@ -0,0 +1,77 @@
+"""Signatures per second of S3Signer against signing from scratch.
+
+The previous functions read and encoded the secret from the environment for
+each signature. A V4 signature without caching also derives the signing key
+with four more HMACs. V2 signatures cost about the same either way, as one
+HMAC dominates them.
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import time
+
+import setup_django
+
+setup_django.setup()
+
+from jasonpi import s3  # noqa: E402
+
+SIGNATURES = 100000
+REPEAT = 5
+SCOPE = ('20180124', 'eu-west-1', 's3')
+HEADERS = {
+    'v2': 'PUT\n\nvideo/mp4\n\nx-amz-date:Wed, 24 Jan 2018 10:00:00 GMT\n'
+          '/bucket/u1/misc/2018-01-24_video.mp4?partNumber=1&uploadId=id',
+    'v4': 'AWS4-HMAC-SHA256\n20180124T100000Z\n'
+          '20180124/eu-west-1/s3/aws4_request\n'
+          '9e0e90d9c76de8fa5b200d8c849cd5b8dc7a3be3951ddb7f6a76b4158342019d',
+}
+
+
+def legacy_v2(headers):
+    return {
+        'signature': base64.b64encode(hmac.new(
+            os.environ.get('AWS_SECRET_ACCESS_KEY').encode('utf-8'),
+            headers.encode('utf-8'),
+            hashlib.sha1,
+        ).digest()).decode('utf-8'),
+    }
+
+
+def legacy_v4(headers):
+    key = ('AWS4' + os.environ.get('AWS_SECRET_ACCESS_KEY')).encode('utf-8')
+    for part in SCOPE + ('aws4_request', ):
+        key = hmac.new(key, part.encode('utf-8'), hashlib.sha256).digest()
+    return {
+        'signature':
+            hmac.new(key, headers.encode('utf-8'), hashlib.sha256).hexdigest(),
+    }
+
+
+def signer(headers):
+    return s3.get_signer().sign_headers(headers)
+
+
+def main():
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark-secret-key')
+    for name, sign, headers in (
+        ('v2 from scratch', legacy_v2, HEADERS['v2']),
+        ('v2 S3Signer', signer, HEADERS['v2']),
+        ('v4 from scratch', legacy_v4, HEADERS['v4']),
+        ('v4 S3Signer', signer, HEADERS['v4']),
+    ):
+        timings = []
+        for _ in range(REPEAT):
+            start = time.perf_counter()
+            for _ in range(SIGNATURES):
+                sign(headers)
+            timings.append(time.perf_counter() - start)
+        # the best run is the least disturbed by the rest of the machine
+        elapsed = min(timings)
+        print('%-18s %10.0f signatures/sec' % (name, SIGNATURES / elapsed))
+
+
+if __name__ == '__main__':
+    main()
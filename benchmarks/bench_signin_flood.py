@@ -0,0 +1,80 @@
+"""Latency of an unrelated endpoint while sign ins flood the workers.
+
+Request workers are simulated by a thread pool. Wrong passwords are posted
+to AuthSignInView while a cheap endpoint is called at a steady rate, with
+passwords hashed inline and then in the bounded hashing pool.
+"""
+
+import concurrent.futures
+import os
+import tempfile
+import time
+
+import setup_django
+
+setup_django.setup(os.path.join(tempfile.mkdtemp(), 'bench.sqlite3'))
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from rest_framework.test import APIRequestFactory  # noqa: E402
+
+from jasonpi import views  # noqa: E402
+
+REQUEST_WORKERS = 8
+SIGN_INS = 64
+PROBES = 100
+PROBE_INTERVAL = 0.02
+
+factory = APIRequestFactory()
+signin = views.AuthSignInView.as_view()
+
+
+def sign_in():
+    request = factory.post(
+        '/auth/signin',
+        {'email': 'bench@email.com', 'password': 'wrong'},
+        format='json',
+    )
+    return signin(request).status_code
+
+
+def probe(submitted):
+    views.signout(factory.get('/auth/signout'))
+    return time.perf_counter() - submitted
+
+
+def run():
+    statuses = []
+    latencies = []
+    with concurrent.futures.ThreadPoolExecutor(REQUEST_WORKERS) as server:
+        floods = [server.submit(sign_in) for _ in range(SIGN_INS)]
+        probes = []
+        for _ in range(PROBES):
+            probes.append(server.submit(probe, time.perf_counter()))
+            time.sleep(PROBE_INTERVAL)
+        statuses = [f.result() for f in floods]
+        latencies = sorted(f.result() for f in probes)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    return p99, statuses.count(503)
+
+
+def main():
+    hashers = ['django.contrib.auth.hashers.PBKDF2PasswordHasher']
+    with override_settings(PASSWORD_HASHERS=hashers):
+        get_user_model().objects.create_user('bench@email.com', 'password')
+        workers = max(1, (os.cpu_count() or 2) // 2)
+        for options in ({}, {
+            'JASONPI_HASHER_WORKERS': workers,
+            'JASONPI_HASHER_QUEUE_SIZE': workers,
+        }):
+            with override_settings(**options):
+                p99, rejected = run()
+            print('%-22s probe p99=%8.1f ms  rejected sign ins=%d' % (
+                'pool of %d workers' % workers if options else 'inline',
+                p99 * 1000,
+                rejected,
+            ))
+
+
+if __name__ == '__main__':
+    main()
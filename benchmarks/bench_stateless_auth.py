@@ -0,0 +1,51 @@
+"""Compare the queries issued by JWTAuthentication with stateless tokens."""
+
+import time
+
+import setup_django
+
+setup_django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+from rest_framework.test import APIRequestFactory  # noqa: E402
+
+from jasonpi.auth import JWTAuthentication, get_token  # noqa: E402
+
+REQUESTS = 5000
+
+User = get_user_model()
+
+
+def run(stateless):
+    user = User.objects.get(email='bench@email.com')
+    with override_settings(JASONPI_STATELESS_TOKEN=stateless):
+        request = APIRequestFactory().get(
+            '/',
+            HTTP_AUTHORIZATION='Bearer %s' % get_token(user),
+        )
+        authentication = JWTAuthentication()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for _ in range(REQUESTS):
+                authenticated, _ = authentication.authenticate(request)
+                authenticated.email
+            elapsed = time.perf_counter() - start
+    return len(queries), elapsed
+
+
+def main():
+    User.objects.create_user('bench@email.com', 'password')
+    for stateless in (False, True):
+        count, elapsed = run(stateless)
+        print('stateless=%-5s queries/request=%.2f us/request=%.1f' % (
+            stateless,
+            count / REQUESTS,
+            elapsed / REQUESTS * 1e6,
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Cost of a throttle check, token bucket against DRF's timestamp history.
+
+DRF's SimpleRateThrottle keeps the list of request timestamps of the
+period, so its cost grows with the allowed rate. The token bucket stores
+two numbers whatever the rate.
+"""
+
+import timeit
+
+import setup_django
+
+setup_django.setup()
+
+from django.core.cache import cache  # noqa: E402
+from django.test import override_settings  # noqa: E402
+from rest_framework.test import APIRequestFactory  # noqa: E402
+from rest_framework.throttling import SimpleRateThrottle  # noqa: E402
+
+from jasonpi.throttling import IPThrottle  # noqa: E402
+
+CHECKS = 20000
+
+
+class View(object):
+    throttle_scope = 'bench'
+
+
+class HistoryThrottle(SimpleRateThrottle):
+    scope = 'bench_ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': self.get_ident(request),
+        }
+
+
+def main():
+    request = APIRequestFactory().get('/')
+    view = View()
+    for rate in ('100/min', '10000/min', '1000000/day'):
+        with override_settings(JASONPI_THROTTLE_RATES={'bench_ip': rate}):
+            HistoryThrottle.THROTTLE_RATES = {'bench_ip': rate}
+            for throttle in (IPThrottle(), HistoryThrottle()):
+                cache.clear()
+                seconds = timeit.timeit(
+                    lambda: throttle.allow_request(request, view),
+                    number=CHECKS,
+                )
+                print('%-12s %-16s %7.2f us/check' % (
+                    rate,
+                    type(throttle).__name__,
+                    seconds / CHECKS * 1e6,
+                ))
+
+
+if __name__ == '__main__':
+    main()
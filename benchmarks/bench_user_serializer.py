@@ -0,0 +1,92 @@
+"""Per-object overhead of UserSerializer field selection over 10k users.
+
+Each user is serialized on its own, as detail views and included resources
+do, then all of them at once with many=True. LegacyUserSerializer restores
+the previous get_fields, which built every field and copied the field dict
+for each instantiation. The best of a few rounds is reported.
+"""
+
+import time
+
+import setup_django
+
+setup_django.setup()
+
+from django.contrib.auth import get_user_model  # noqa: E402
+from rest_framework.request import Request  # noqa: E402
+from rest_framework.test import APIRequestFactory  # noqa: E402
+
+from testapp.serializers import UserSerializer  # noqa: E402
+
+USERS = 10000
+ROUNDS = 3
+
+User = get_user_model()
+
+
+class LegacyUserSerializer(UserSerializer):
+
+    def get_field_names(self, declared_fields, info):
+        return super(UserSerializer, self).get_field_names(
+            declared_fields,
+            info,
+        )
+
+    def get_fields(self):
+        fields = super(UserSerializer, self).get_fields()
+        limited_fields = getattr(self.Meta, 'limited_fields', fields)
+        request = self.context.get('request', None)
+        instance = self.instance
+        if (
+                instance and
+                request is not None and
+                hasattr(request, 'user') and
+                request.user != instance
+        ) or type(instance) == list:  # noqa: E721
+            result = fields.copy()
+            for field in fields:
+                if field not in limited_fields:
+                    result.pop(field)
+            return result
+        return fields
+
+
+def main():
+    User.objects.bulk_create([
+        User(
+            email='user%d@email.com' % i,
+            email_canonical='user%d@email.com' % i,
+            first_name='User',
+            last_name=str(i),
+        )
+        for i in range(USERS)
+    ])
+    users = list(User.objects.all())
+    request = Request(APIRequestFactory().get('/users'))
+    request.user = users[0]
+    context = {'request': request}
+    best = {}
+    for _ in range(ROUNDS):
+        for serializer_class in (LegacyUserSerializer, UserSerializer):
+            start = time.perf_counter()
+            for user in users:
+                serializer_class(user, context=context).data
+            single = time.perf_counter() - start
+            start = time.perf_counter()
+            serializer_class(users, many=True, context=context).data
+            many = time.perf_counter() - start
+            previous = best.get(serializer_class, (single, many))
+            best[serializer_class] = (
+                min(previous[0], single),
+                min(previous[1], many),
+            )
+    for serializer_class, (single, many) in best.items():
+        print('%-22s %8.1f us/object alone %8.1f us/object in a list' % (
+            serializer_class.__name__,
+            single / USERS * 1e6,
+            many / USERS * 1e6,
+        ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,26 @@
+"""Configure django for the benchmark scripts using the test settings."""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'testapp.settings')
+
+
+def setup(database=None):
+    """Set up django and create the tables of the benchmark database.
+
+    The database is in memory unless a file is given, which is needed when
+    several threads query it.
+    """
+    import django
+    from django.conf import settings
+    from django.core.management import call_command
+
+    if database is not None:
+        settings.DATABASES['default']['NAME'] = database
+    django.setup()
+    call_command('migrate', run_syncdb=True, verbosity=0)
@@ -1,5 +1,12 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class JasonpiConfig(AppConfig):
     name = 'jasonpi'
+
+    def ready(self):
+        from jasonpi import signals  # noqa: F401
+        if getattr(settings, 'JASONPI_GOOGLE_WARM_UP', False):
+            from jasonpi.discovery import warm_up
+            warm_up()
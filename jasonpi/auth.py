@@ -1,37 +1,133 @@
 """Auth utils module."""
 
 import datetime
+import hashlib
+import time
+import uuid
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import router
 
 import jwt
 
 from rest_framework import exceptions, views
 from rest_framework.authentication import BaseAuthentication
 
+from jasonpi.cache import get_token_cache, get_user_cache
+from jasonpi.keys import get_keyring
+from jasonpi.refresh import revoke_user_refresh_tokens
+from jasonpi.revocation import get_revocation_list
+
 User = get_user_model()
 
+# Version of the claims embedded in stateless tokens, bump it whenever
+# the set of claims changes so that older tokens fall back to a lookup.
+TOKEN_CLAIMS_VERSION = 1
+
+
+def is_stateless():
+    """Return whether tokens carry the claims needed to skip user lookups."""
+    return getattr(settings, 'JASONPI_STATELESS_TOKEN', False)
+
 
 def get_token(user):
     """Generate a jwt token from a user."""
-    token = jwt.encode(
-        {
-            'exp': datetime.datetime.utcnow() +
-            getattr(
-                settings,
-                'JASONPI_TOKEN_DURATION',
-                datetime.timedelta(days=1),
-            ),
-            'user_id': user.id,
-        },
-        settings.SECRET_KEY,
-        algorithm='HS256',
+    payload = {
+        'exp': datetime.datetime.utcnow() +
+        getattr(
+            settings,
+            'JASONPI_TOKEN_DURATION',
+            datetime.timedelta(days=1),
+        ),
+        # exact issue time, compared with revocation watermarks
+        'iat': time.time(),
+        'jti': uuid.uuid4().hex,
+        'user_id': user.id,
+    }
+    if is_stateless():
+        payload.update({
+            'ver': TOKEN_CLAIMS_VERSION,
+            'email': user.email,
+            'is_staff': user.is_staff,
+        })
+    return get_keyring().sign(payload)
+
+
+def decode_token(token):
+    """Verify a jwt token and return its claims.
+
+    Verified claims are cached by digest of the token until the token
+    expires, so a token seen again skips the signature check.
+    """
+    cache = get_token_cache()
+    if cache is not None:
+        key = hashlib.sha256(token.encode('utf-8')).digest()
+        payload = cache.get(key)
+        if payload is not None:
+            return dict(payload)
+    payload = get_keyring().verify(token)
+    if cache is not None and 'exp' in payload:
+        timeout = payload['exp'] - time.time()
+        if timeout > 0:
+            cache.set(key, dict(payload), timeout=timeout)
+    return payload
+
+
+def token_user(payload):
+    """Return the user built from the claims of a stateless token.
+
+    The user is a model instance holding the fields carried by the token,
+    every other field is deferred and loaded from the database on access.
+    Saving it never writes back claims left unchanged, which may be older
+    than the database.
+    """
+    claims = {
+        'email': payload['email'],
+        'is_staff': payload['is_staff'],
+    }
+    fields = dict(claims, **{User._meta.pk.attname: payload['user_id']})
+    names = [
+        field.attname for field in User._meta.concrete_fields
+        if field.attname in fields
+    ]
+    user = User.from_db(
+        router.db_for_read(User),
+        names,
+        [fields[name] for name in names],
     )
-    if type(token) == bytes:
-        return token.decode('utf-8')
-    else:
-        return token
+    user._token_claims = claims
+    return user
+
+
+def get_request_token(request):
+    """Return the jwt token sent with request, if any."""
+    authorization = request.META.get('HTTP_AUTHORIZATION', None)
+    if authorization is not None and authorization.find('Bearer ') == 0:
+        return authorization[7:]
+    return request.COOKIES.get('access_token')
+
+
+def revoke_token(token):
+    """Revoke token until it expires, ignore invalid tokens."""
+    revocation_list = get_revocation_list()
+    if revocation_list is None:
+        return
+    try:
+        payload = decode_token(token)
+    except jwt.InvalidTokenError:
+        return
+    if 'jti' in payload:
+        revocation_list.revoke(payload)
+
+
+def revoke_user_tokens(user):
+    """Revoke every token issued to user so far, refresh tokens included,
+    so that none can mint a new access token."""
+    revoke_user_refresh_tokens(user)
+    revocation_list = get_revocation_list()
+    if revocation_list is not None:
+        revocation_list.revoke_user(user.pk)
 
 
 class JWTAuthentication(BaseAuthentication):
@@ -39,22 +135,22 @@ class JWTAuthentication(BaseAuthentication):
 
     def authenticate(self, request):
         """Authenticate a request using jwt."""
-        token = None
-        authorization = request.META.get('HTTP_AUTHORIZATION', None)
-        if authorization is not None and authorization.find('Bearer ') == 0:
-            token = authorization[7:]
-        elif 'access_token' in request.COOKIES:
-            token = request.COOKIES['access_token']
+        token = get_request_token(request)
         if token is None:
             return None
         try:
-            return (User.objects.get(
-                pk=jwt.decode(
-                    token,
-                    settings.SECRET_KEY,
-                    algorithm='HS256',
-                )['user_id'],
-            ), token)
+            payload = decode_token(token)
+            revocation_list = get_revocation_list()
+            if revocation_list is not None and \
+                    revocation_list.is_revoked(payload):
+                raise exceptions.AuthenticationFailed('Invalid token')
+            if is_stateless() and \
+                    payload.get('ver') == TOKEN_CLAIMS_VERSION:
+                return (token_user(payload), token)
+            cache = get_user_cache()
+            if cache is not None:
+                return (cache.load(payload['user_id']), token)
+            return (User.objects.get(pk=payload['user_id']), token)
         except Exception as e:
             raise exceptions.AuthenticationFailed('Invalid token')
 
@@ -1,3 +1,8 @@
+import concurrent.futures
+import itertools
+import os
+
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import (
     BaseUserManager,
     AbstractUser,
@@ -6,11 +11,37 @@ from django.db import models
 from django.utils.translation import ugettext_lazy as _
 
 
+def canonical_email(email):
+    """Return the case insensitive form of email, used for lookups."""
+    return email.lower()
+
+
 class UserEmailManager(BaseUserManager):
     """Define a model manager for User model with no username field."""
 
     use_in_migrations = True
 
+    def get_by_email(self, email):
+        """Return the user owning email, ignoring its case.
+
+        The lookup seeks the indexed canonical email. Among users whose
+        emails only differ by case, the exact match wins. Rows saved
+        before the canonical email existed are found by their email until
+        `jasonpi_backfill_canonical_emails` has run.
+        """
+        if not isinstance(email, str):
+            raise self.model.DoesNotExist()
+        users = list(self.filter(
+            models.Q(email_canonical=canonical_email(email)) |
+            models.Q(email_canonical__isnull=True, email=email)
+        ))
+        if len(users) == 1:
+            return users[0]
+        for user in users:
+            if user.email == email:
+                return user
+        raise self.model.DoesNotExist()
+
     def _create_user(self, email, password, **extra_fields):
         """Create and save a User with the given email and password."""
         if not email:
@@ -27,6 +58,57 @@ class UserEmailManager(BaseUserManager):
         extra_fields.setdefault('is_superuser', False)
         return self._create_user(email, password, **extra_fields)
 
+    def bulk_create_users(self, users, batch_size=1000, workers=None,
+                          callback=None):
+        """Create regular Users from dicts of fields and a raw `password`.
+
+        Passwords are hashed by a pool of `workers` processes, one per core
+        by default, and each batch is saved with bulk_create while the next
+        one is being hashed. callback is called with the number of users
+        created after each batch. Return the created users.
+        """
+        workers = workers or os.cpu_count() or 1
+        users = iter(users)
+        created = []
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+
+            def hash_batch():
+                batch = list(itertools.islice(users, batch_size))
+                hashes = executor.map(
+                    make_password,
+                    [fields.get('password') for fields in batch],
+                    chunksize=max(1, len(batch) // (workers * 4)),
+                )
+                return batch, hashes
+
+            batch, hashes = hash_batch()
+            while batch:
+                next_batch, next_hashes = hash_batch()
+                created.extend(self.bulk_create([
+                    self._build_user(fields, encoded)
+                    for fields, encoded in zip(batch, hashes)
+                ]))
+                if callback is not None:
+                    callback(len(created))
+                batch, hashes = next_batch, next_hashes
+        return created
+
+    def _build_user(self, fields, encoded):
+        fields = dict(fields)
+        fields.pop('password', None)
+        email = fields.pop('email', None)
+        if not email:
+            raise ValueError('The given email must be set')
+        fields.setdefault('is_staff', False)
+        fields.setdefault('is_superuser', False)
+        email = self.normalize_email(email)
+        return self.model(
+            email=email,
+            email_canonical=canonical_email(email),
+            password=encoded,
+            **fields
+        )
+
     def create_superuser(self, email, password, **extra_fields):
         """Create and save a SuperUser with the given email and password."""
         extra_fields.setdefault('is_staff', True)
@@ -48,14 +130,53 @@ class BaseUser(AbstractUser):
 
     username = None
     email = models.EmailField(_('email address'), unique=True)
+    email_canonical = models.EmailField(
+        null=True,
+        editable=False,
+        db_index=True,
+    )
     birthday = models.DateField(null=True, blank=True)
     gender = models.CharField(max_length=255, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    # indexed for the email filter, which syncs recently updated users
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return '%s %s <%s>' % (self.first_name, self.last_name, self.email)
 
+    def save(self, *args, **kwargs):
+        self.email_canonical = canonical_email(self.email)
+        update_fields = kwargs.get('update_fields')
+        claims = self.__dict__.get('_token_claims')
+        if claims and update_fields is None and not self._state.adding:
+            # the claims of a stateless token may be older than the row,
+            # they are only written when changed since
+            skipped = {
+                name for name, value in claims.items()
+                if getattr(self, name) == value
+            }
+            if 'email' in skipped:
+                skipped.add('email_canonical')
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key and
+                field.attname not in deferred and
+                field.attname not in skipped
+            ]
+        elif update_fields is not None and 'email' in update_fields:
+            kwargs['update_fields'] = list(update_fields) + \
+                ['email_canonical']
+        super(BaseUser, self).save(*args, **kwargs)
+
+    def refresh_from_db(self, using=None, fields=None):
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred and set(fields) <= deferred:
+            # the first deferred field read loads the others with it, e.g.
+            # for users built from the claims of a stateless token
+            fields = deferred
+        super(BaseUser, self).refresh_from_db(using=using, fields=fields)
+
     class Meta:
         ordering = ['id']
         abstract = True
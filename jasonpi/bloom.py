@@ -0,0 +1,246 @@
+"""Bloom filter of registered emails used to fast-fail unknown sign ins.
+
+A miss in the filter proves that no user has the email, so the sign in can
+be refused without querying the database. Hits may be false positives and
+go through the regular lookup.
+"""
+
+import datetime
+import hashlib
+import math
+import struct
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.utils import timezone
+
+from jasonpi.base import canonical_email
+
+
+class BloomFilter(object):
+    """Probabilistic set answering `in` without false negatives."""
+
+    def __init__(self, capacity, error_rate=0.001):
+        size = -capacity * math.log(error_rate) / math.log(2) ** 2
+        self.size = max(8, int(math.ceil(size)))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1, h2 = struct.unpack('<QQ', digest)
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        for position in self.positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(
+            bits[position >> 3] & (1 << (position & 7))
+            for position in self.positions(item)
+        )
+
+    def to_bytes(self):
+        return struct.pack('<QQ', self.size, self.hashes) + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data):
+        bloom = cls.__new__(cls)
+        bloom.size, bloom.hashes = struct.unpack('<QQ', data[:16])
+        bloom.bits = bytearray(data[16:])
+        return bloom
+
+
+def email_key(email):
+    """Return the key of email, canonical so lookups never miss."""
+    return canonical_email(email)
+
+
+class EmailFilter(object):
+    """Bloom filter of the emails of every user.
+
+    The filter is built on first use from the copy shared through the
+    django cache `JASONPI_EMAIL_FILTER_CACHE` when the
+    `jasonpi_rebuild_email_filter` command or another process stored one
+    less than `rebuild_interval` seconds ago, from the users table
+    otherwise. Users created or updated since are added every
+    `sync_interval` seconds, saves made by this process right away, and the
+    whole filter is rebuilt every `rebuild_interval` seconds.
+
+    Builds and syncs run in the thread that finds the filter out of date,
+    without holding the lock: the other threads keep using the current
+    filter meanwhile, and consider every email possible before the first
+    build.
+    """
+
+    cache_key = 'jasonpi:email-filter'
+    recent_key_prefix = 'jasonpi:email-filter:recent:'
+    # seconds between a save and its commit still caught by the next sync
+    sync_overlap = 60
+
+    def __init__(self, capacity, error_rate, sync_interval=5,
+                 rebuild_interval=3600, cache=None):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self.rebuild_interval = rebuild_interval
+        self.cache = caches[cache] if cache is not None else None
+        self.bloom = None
+        # users updated before synced_through are in the filter
+        self.synced_through = None
+        self.synced_at = self.built_at = 0
+        self.syncing = False
+        self._lock = threading.Lock()
+
+    def build(self):
+        """Return a filter of every email and the time it was built."""
+        built = timezone.now()
+        users = get_user_model().objects
+        bloom = BloomFilter(
+            max(self.capacity, users.count() * 2),
+            self.error_rate,
+        )
+        for email in users.values_list('email', flat=True).iterator():
+            bloom.add(email_key(email))
+        return bloom, built
+
+    def store(self):
+        """Build the filter and share it through the django cache."""
+        bloom, built = self.build()
+        if self.cache is not None:
+            self.cache.set(
+                self.cache_key,
+                (built.timestamp(), bloom.to_bytes()),
+                timeout=None,
+            )
+        return bloom, built
+
+    def load(self):
+        if self.cache is None:
+            return self.build()
+        shared = self.cache.get(self.cache_key)
+        if shared is not None and \
+                time.time() - shared[0] <= self.rebuild_interval:
+            built, data = shared
+            return BloomFilter.from_bytes(data), \
+                datetime.datetime.fromtimestamp(built, datetime.timezone.utc)
+        # missing or out of date copies are replaced
+        return self.store()
+
+    def changed(self, since):
+        """Return the emails of the users updated since, give or take the
+        overlap."""
+        return get_user_model().objects \
+            .filter(updated_at__gte=since - datetime.timedelta(
+                seconds=self.sync_overlap)) \
+            .values_list('email', flat=True)
+
+    def needs_sync(self, now):
+        if self.bloom is None or now - self.built_at > self.rebuild_interval:
+            return True
+        return now - self.synced_at > self.sync_interval
+
+    def sync(self):
+        """Bring the filter up to date unless another thread is at it."""
+        if not self.needs_sync(time.monotonic()):
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self.syncing or not self.needs_sync(now):
+                return
+            self.syncing = True
+        try:
+            if self.bloom is None or \
+                    now - self.built_at > self.rebuild_interval:
+                bloom, synced_through = self.load()
+                # the new filter replaces the old one once complete
+                self.bloom, self.built_at = bloom, now
+            else:
+                synced_through = timezone.now()
+                for email in self.changed(self.synced_through).iterator():
+                    self.bloom.add(email_key(email))
+            self.synced_through = synced_through
+            self.synced_at = now
+        finally:
+            self.syncing = False
+
+    def recent_key(self, email):
+        return self.recent_key_prefix + hashlib.sha256(
+            email_key(email).encode('utf-8')).hexdigest()
+
+    def add(self, email):
+        """Record email, e.g. when a user is saved."""
+        bloom = self.bloom
+        if bloom is not None:
+            bloom.add(email_key(email))
+        if self.cache is not None:
+            # visible to other processes until their next sync
+            self.cache.set(
+                self.recent_key(email),
+                True,
+                timeout=self.rebuild_interval * 2,
+            )
+
+    def might_exist(self, email):
+        """Return False only when no user has email."""
+        if not isinstance(email, str):
+            return False
+        self.sync()
+        bloom = self.bloom
+        if bloom is None or email_key(email) in bloom:
+            return True
+        if self.cache is not None:
+            return self.cache.get(self.recent_key(email), False)
+        return False
+
+
+_filter = None
+_lock = threading.Lock()
+
+
+def get_email_filter():
+    """Return the email filter or None when it is disabled."""
+    global _filter
+    if not getattr(settings, 'JASONPI_EMAIL_FILTER', False):
+        return None
+    if _filter is None:
+        with _lock:
+            if _filter is None:
+                _filter = EmailFilter(
+                    capacity=getattr(
+                        settings,
+                        'JASONPI_EMAIL_FILTER_CAPACITY',
+                        100000,
+                    ),
+                    error_rate=getattr(
+                        settings,
+                        'JASONPI_EMAIL_FILTER_ERROR_RATE',
+                        0.001,
+                    ),
+                    sync_interval=getattr(
+                        settings,
+                        'JASONPI_EMAIL_FILTER_SYNC_INTERVAL',
+                        5,
+                    ),
+                    rebuild_interval=getattr(
+                        settings,
+                        'JASONPI_EMAIL_FILTER_REBUILD_INTERVAL',
+                        3600,
+                    ),
+                    cache=getattr(
+                        settings,
+                        'JASONPI_EMAIL_FILTER_CACHE',
+                        None,
+                    ),
+                )
+    return _filter
+
+
+def reset_email_filter():
+    global _filter
+    _filter = None
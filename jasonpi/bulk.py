@@ -0,0 +1,267 @@
+"""Streaming import and export of users with their providers.
+
+Records are dicts holding user fields, a pre-hashed `password` and a list
+of `providers` as `{'provider': ..., 'uid': ...}` dicts. They are read
+from and written to JSON lines or CSV files one at a time, and written to
+the database in batches, so that memory does not grow with the file.
+In CSV files providers are a space separated list of `provider:uid`.
+"""
+
+import csv
+import datetime
+import itertools
+import json
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import \
+    UNUSABLE_PASSWORD_PREFIX, \
+    identify_hasher, \
+    make_password
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from jasonpi.base import canonical_email
+from jasonpi.models import Provider
+
+FIELDS = (
+    'email',
+    'password',
+    'first_name',
+    'last_name',
+    'is_active',
+    'is_staff',
+    'is_superuser',
+    'date_joined',
+    'birthday',
+    'gender',
+)
+BOOLEAN_FIELDS = ('is_active', 'is_staff', 'is_superuser')
+FORMATS = ('jsonl', 'csv')
+
+
+class RecordError(ValueError):
+    """Raised for a record that can't be imported."""
+
+    def __init__(self, line, message):
+        super(RecordError, self).__init__('line %d: %s' % (line, message))
+
+
+def user_fields():
+    """Return the transferred fields existing on the user model."""
+    names = {field.name for field in get_user_model()._meta.get_fields()}
+    return [field for field in FIELDS if field in names]
+
+
+def guess_format(path):
+    return 'csv' if path.endswith('.csv') else 'jsonl'
+
+
+def read_records(stream, format='jsonl'):
+    """Yield the records of stream, a text file."""
+    if format == 'csv':
+        for record in csv.DictReader(stream):
+            providers = record.get('providers') or ''
+            record['providers'] = [
+                dict(zip(('provider', 'uid'), link.split(':', 1)))
+                for link in providers.split()
+            ]
+            yield record
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
+
+
+def to_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+
+def build_user(record, line):
+    """Return an unsaved user and its providers from record."""
+    User = get_user_model()
+    fields = {}
+    for name in user_fields():
+        value = record.get(name)
+        if value is None or value == '':
+            continue
+        if name in BOOLEAN_FIELDS:
+            value = to_bool(value)
+        elif name == 'date_joined' and isinstance(value, str):
+            value = parse_datetime(value)
+        elif name == 'birthday' and isinstance(value, str):
+            value = parse_date(value)
+        fields[name] = value
+    if not fields.get('email'):
+        raise RecordError(line, 'missing email')
+    fields['email'] = User.objects.normalize_email(fields['email'])
+    # bulk_create doesn't call save, which maintains the canonical email
+    fields['email_canonical'] = canonical_email(fields['email'])
+    if 'password' in fields and \
+            not fields['password'].startswith(UNUSABLE_PASSWORD_PREFIX):
+        try:
+            identify_hasher(fields['password'])
+        except ValueError:
+            raise RecordError(line, 'password is not a known hash')
+    elif 'password' not in fields:
+        fields['password'] = make_password(None)
+    if isinstance(fields.get('date_joined'), datetime.datetime) and \
+            timezone.is_naive(fields['date_joined']):
+        fields['date_joined'] = timezone.make_aware(fields['date_joined'])
+    providers = []
+    for link in record.get('providers') or ():
+        if not isinstance(link, dict) or not link.get('provider') or \
+                not link.get('uid'):
+            raise RecordError(line, 'invalid provider %r' % (link, ))
+        providers.append((link['provider'], link['uid']))
+    return User(**fields), providers
+
+
+def import_batch(batch):
+    """Insert the (user, providers) of batch missing from the database.
+
+    Return the number of users and providers created.
+    """
+    User = get_user_model()
+    users = {}
+    for user, providers in batch:
+        users.setdefault(user.email_canonical, (user, providers))
+    with transaction.atomic():
+        existing = User.objects \
+            .filter(
+                Q(email_canonical__in=list(users)) |
+                Q(email__in=[user.email for user, _ in users.values()])
+            ) \
+            .values_list('email', flat=True)
+        existing = {canonical_email(email) for email in existing}
+        created = User.objects.bulk_create([
+            user for key, (user, _) in users.items()
+            if key not in existing
+        ])
+        if created and created[0].pk is None:
+            # backends not returning the primary keys of inserted rows
+            pks = dict(
+                User.objects
+                .filter(email__in=[user.email for user in created])
+                .values_list('email', 'pk')
+            )
+            for user in created:
+                user.pk = pks[user.email]
+        links = Provider.objects.bulk_create([
+            Provider(user_id=user.pk, provider=provider, uid=uid)
+            for user in created
+            for provider, uid in users[user.email_canonical][1]
+        ], ignore_conflicts=True)
+        inserted = 0
+        if links:
+            # bulk_create returns the rows skipped on conflict too
+            inserted = Provider.objects \
+                .filter(user_id__in=[user.pk for user in created]) \
+                .count()
+    return len(created), inserted
+
+
+def import_users(records, batch_size=1000, callback=None):
+    """Import records in batches of batch_size, one transaction each.
+
+    callback is called after each batch with the stats so far. Return a
+    dict of stats: rows read, users and providers created and seconds.
+    """
+    stats = {'rows': 0, 'users': 0, 'providers': 0, 'seconds': 0}
+    start = time.perf_counter()
+    records = iter(records)
+    while True:
+        chunk = list(itertools.islice(records, batch_size))
+        if not chunk:
+            break
+        batch = [
+            build_user(record, stats['rows'] + index + 1)
+            for index, record in enumerate(chunk)
+        ]
+        users, providers = import_batch(batch)
+        stats['rows'] += len(chunk)
+        stats['users'] += users
+        stats['providers'] += providers
+        stats['seconds'] = time.perf_counter() - start
+        if callback is not None:
+            callback(stats)
+    stats['seconds'] = time.perf_counter() - start
+    return stats
+
+
+def export_records(batch_size=1000):
+    """Yield lists of up to batch_size records of every user."""
+    fields = user_fields()
+    users = get_user_model().objects \
+        .order_by('pk') \
+        .values_list('pk', *fields) \
+        .iterator(chunk_size=batch_size)
+    while True:
+        rows = list(itertools.islice(users, batch_size))
+        if not rows:
+            break
+        links = {}
+        providers = Provider.objects \
+            .filter(user_id__in=[row[0] for row in rows]) \
+            .order_by('pk') \
+            .values_list('user_id', 'provider', 'uid')
+        for user_id, provider, uid in providers:
+            links.setdefault(user_id, []).append(
+                {'provider': provider, 'uid': uid})
+        records = []
+        for row in rows:
+            record = dict(zip(fields, row[1:]))
+            for name in ('date_joined', 'birthday'):
+                if record.get(name) is not None:
+                    record[name] = record[name].isoformat()
+            record['providers'] = links.get(row[0], [])
+            records.append(record)
+        yield records
+
+
+def write_records(stream, batches, format='jsonl'):
+    """Write batches of records to stream with one write per batch.
+
+    Return the number of records written.
+    """
+    count = 0
+    if format == 'csv':
+        buffer = Buffer()
+        writer = csv.DictWriter(buffer, user_fields() + ['providers'])
+        writer.writeheader()
+        for records in batches:
+            for record in records:
+                record['providers'] = ' '.join(
+                    '%(provider)s:%(uid)s' % link
+                    for link in record['providers']
+                )
+            writer.writerows(records)
+            stream.write(buffer.flush())
+            count += len(records)
+        stream.write(buffer.flush())
+    else:
+        for records in batches:
+            stream.write(''.join(
+                json.dumps(record) + '\n' for record in records
+            ))
+            count += len(records)
+    return count
+
+
+class Buffer(object):
+    """File-like object collecting the rows of a csv writer."""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data):
+        self.parts.append(data)
+
+    def flush(self):
+        data = ''.join(self.parts)
+        self.parts = []
+        return data
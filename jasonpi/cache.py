@@ -0,0 +1,209 @@
+"""In-process caches used on the authentication hot path."""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+
+class LRUCache(object):
+    """Thread-safe LRU cache whose entries expire after a timeout."""
+
+    def __init__(self, maxsize=1024, timeout=None):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        """Return the value stored for key if it has not expired."""
+        with self._lock:
+            try:
+                value, expires = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, timeout=None):
+        """Store value for key, evicting the least recently used entry."""
+        if timeout is None:
+            timeout = self.timeout
+        expires = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        """Remove key from the cache."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Remove every entry and reset the counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Return the counters used to size the cache."""
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+
+class UserCache(object):
+    """Resolve users by primary key through a local and a shared cache.
+
+    The local tier is an `LRUCache`, the optional shared tier is the django
+    cache named by `JASONPI_USER_CACHE_BACKEND`. Entries are invalidated
+    by the signal handlers of `jasonpi.signals`.
+    """
+
+    key_prefix = 'jasonpi:user:'
+
+    def __init__(self, maxsize=1024, timeout=60, backend=None):
+        self.local = LRUCache(maxsize=maxsize, timeout=timeout)
+        self.timeout = timeout
+        self.backend = caches[backend] if backend is not None else None
+
+    def make_key(self, pk):
+        return '%s%s' % (self.key_prefix, pk)
+
+    def get(self, pk):
+        """Return a copy of the cached user or None."""
+        user = self.local.get(pk)
+        if user is None and self.backend is not None:
+            user = self.backend.get(self.make_key(pk))
+            if user is not None:
+                self.local.set(pk, user)
+        if user is None:
+            return None
+        # copies keep views from mutating the instance shared by threads
+        return copy.copy(user)
+
+    def set(self, user):
+        self.local.set(user.pk, user)
+        if self.backend is not None:
+            self.backend.set(self.make_key(user.pk), user, self.timeout)
+
+    def load(self, pk):
+        """Return the user from the cache, falling back to the database."""
+        user = self.get(pk)
+        if user is None:
+            user = get_user_model().objects.get(pk=pk)
+            self.set(copy.copy(user))
+        return user
+
+    def invalidate(self, pk):
+        self.local.delete(pk)
+        if self.backend is not None:
+            self.backend.delete(self.make_key(pk))
+
+    def stats(self):
+        return self.local.stats()
+
+
+_user_cache = None
+_lock = threading.Lock()
+
+
+def get_user_cache():
+    """Return the configured user cache or None when it is disabled."""
+    global _user_cache
+    path = getattr(settings, 'JASONPI_USER_CACHE', None)
+    if path is None:
+        return None
+    if _user_cache is None:
+        with _lock:
+            if _user_cache is None:
+                _user_cache = import_string(path)(
+                    maxsize=getattr(settings, 'JASONPI_USER_CACHE_SIZE', 1024),
+                    timeout=getattr(settings, 'JASONPI_USER_CACHE_TTL', 60),
+                    backend=getattr(
+                        settings,
+                        'JASONPI_USER_CACHE_BACKEND',
+                        None,
+                    ),
+                )
+    return _user_cache
+
+
+def reset_user_cache():
+    """Drop the user cache so that it is rebuilt from the settings."""
+    global _user_cache
+    _user_cache = None
+
+
+_token_cache = None
+
+
+def get_token_cache():
+    """Return the cache of verified token claims or None when disabled."""
+    global _token_cache
+    size = getattr(settings, 'JASONPI_TOKEN_CACHE_SIZE', 1024)
+    if not size:
+        return None
+    if _token_cache is None:
+        with _lock:
+            if _token_cache is None:
+                _token_cache = LRUCache(maxsize=size)
+    return _token_cache
+
+
+def reset_token_cache():
+    """Drop every verified token, e.g. when the signing key changes."""
+    global _token_cache
+    _token_cache = None
+
+
+_profile_cache = None
+
+
+def get_profile_cache():
+    """Return the cache of verified provider profiles or None if disabled."""
+    global _profile_cache
+    timeout = getattr(settings, 'JASONPI_PROVIDER_CACHE_TTL', 0)
+    if not timeout:
+        return None
+    if _profile_cache is None:
+        with _lock:
+            if _profile_cache is None:
+                _profile_cache = LRUCache(
+                    maxsize=getattr(
+                        settings,
+                        'JASONPI_PROVIDER_CACHE_SIZE',
+                        1024,
+                    ),
+                    timeout=timeout,
+                )
+    return _profile_cache
+
+
+def reset_profile_cache():
+    global _profile_cache
+    _profile_cache = None
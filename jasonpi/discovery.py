@@ -0,0 +1,112 @@
+"""Process wide Google People service built from a cached discovery document.
+
+`googleapiclient.discovery.build` downloads and parses the discovery
+document on every call. The service is built here once per process, from a
+disk cache refreshed every `JASONPI_GOOGLE_DISCOVERY_TTL` when
+`JASONPI_GOOGLE_DISCOVERY_CACHE` is set, otherwise from the copy bundled
+with googleapiclient or, failing that, a single download. Requests then
+execute with their own authorized http object.
+"""
+
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+import httplib2
+
+from googleapiclient.discovery import build_from_document
+
+from jasonpi import metrics
+
+logger = logging.getLogger(__name__)
+
+DISCOVERY_URL = 'https://www.googleapis.com/discovery/v1/apis/people/v1/rest'
+
+_service = None
+_lock = threading.Lock()
+
+
+def fetch_document():
+    """Download the discovery document of the People api."""
+    response, content = httplib2.Http().request(DISCOVERY_URL)
+    if response.status != 200:
+        raise IOError(
+            'Unable to fetch %s: %s' % (DISCOVERY_URL, response.status))
+    return content.decode('utf-8')
+
+
+def bundled_document():
+    """Return the copy shipped with googleapiclient if there is one."""
+    try:
+        from googleapiclient.discovery_cache import get_static_doc
+    except ImportError:
+        return None
+    return get_static_doc('people', 'v1')
+
+
+def cached_document(path):
+    """Return the document cached at path, downloading it when stale."""
+    ttl = getattr(settings, 'JASONPI_GOOGLE_DISCOVERY_TTL', 24 * 3600)
+    try:
+        fresh = time.time() - os.path.getmtime(path) < ttl
+    except OSError:
+        fresh = False
+    if not fresh:
+        try:
+            document = fetch_document()
+        except (IOError, httplib2.HttpLib2Error):
+            if not os.path.exists(path):
+                raise
+            logger.warning('Using stale discovery document %s', path)
+        else:
+            directory = os.path.dirname(path) or '.'
+            fd, tmp = tempfile.mkstemp(dir=directory)
+            with os.fdopen(fd, 'w') as f:
+                f.write(document)
+            os.replace(tmp, path)
+            return document
+    with open(path) as f:
+        return f.read()
+
+
+def load_document():
+    path = getattr(settings, 'JASONPI_GOOGLE_DISCOVERY_CACHE', None)
+    if path is not None:
+        return cached_document(path)
+    return bundled_document() or fetch_document()
+
+
+def get_service():
+    """Return the People service, building it on first use."""
+    global _service
+    if _service is None:
+        with _lock:
+            if _service is None:
+                with metrics.timer('jasonpi.google.discovery.build'):
+                    _service = build_from_document(
+                        load_document(),
+                        http=httplib2.Http(),
+                    )
+    return _service
+
+
+def reset_service():
+    global _service
+    _service = None
+
+
+def warm_up():
+    """Build the service in a background thread, e.g. at startup."""
+    def run():
+        try:
+            get_service()
+        except Exception:
+            logger.exception('Unable to build the Google People service')
+    thread = threading.Thread(target=run, name='jasonpi-google-warm-up')
+    thread.daemon = True
+    thread.start()
+    return thread
@@ -0,0 +1,165 @@
+"""Password hashing in a bounded process pool with admission control.
+
+Hashing is deliberately expensive, so a burst of sign ins can occupy every
+request worker. With `JASONPI_HASHER_WORKERS` set, passwords are hashed in a
+process pool and requests beyond its `JASONPI_HASHER_QUEUE_SIZE` waiting
+slots are refused with a 503 instead of queueing.
+"""
+
+import concurrent.futures
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.utils.translation import ugettext_lazy as _
+
+from rest_framework import exceptions
+
+from jasonpi import metrics
+
+
+class HashingUnavailable(exceptions.APIException):
+    status_code = 503
+    default_detail = _('Too many sign in attempts, try again later.')
+    default_code = 'hashing_unavailable'
+
+
+class HashingPool(object):
+    """Process pool refusing work once its workers and queue are full."""
+
+    def __init__(self, workers, queue_size=0):
+        self.workers = workers
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+        )
+        self.in_flight = 0
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._lock = threading.Lock()
+
+    def _track(self, delta):
+        with self._lock:
+            self.in_flight += delta
+            in_flight = self.in_flight
+        metrics.gauge(
+            'jasonpi.hashing.queue_depth',
+            max(0, in_flight - self.workers),
+        )
+
+    def run(self, function, *args):
+        """Call function in the pool, raise HashingUnavailable when full."""
+        if not self._slots.acquire(blocking=False):
+            metrics.incr('jasonpi.hashing.rejected')
+            raise HashingUnavailable()
+        self._track(1)
+        start = time.perf_counter()
+        try:
+            return self.executor.submit(function, *args).result()
+        finally:
+            metrics.observe(
+                'jasonpi.hashing.latency',
+                time.perf_counter() - start,
+            )
+            self._track(-1)
+            self._slots.release()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+_pool = None
+_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the hashing pool or None when hashing runs inline."""
+    global _pool
+    workers = getattr(settings, 'JASONPI_HASHER_WORKERS', 0)
+    if not workers:
+        return None
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = HashingPool(
+                    workers,
+                    getattr(settings, 'JASONPI_HASHER_QUEUE_SIZE', workers),
+                )
+    return _pool
+
+
+def reset_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+    _pool = None
+
+
+_dummy_passwords = {}
+
+
+def dummy_check_password(password):
+    """Spend the time of a password check for a user that doesn't exist.
+
+    Refusing unknown emails faster than wrong passwords would reveal which
+    emails are registered.
+    """
+    hasher = hashers.get_hasher('default')
+    key = (hasher.algorithm, getattr(hasher, 'iterations', None))
+    encoded = _dummy_passwords.get(key)
+    if encoded is None:
+        encoded = _dummy_passwords[key] = hasher.encode(
+            'jasonpi-dummy-password', hasher.salt())
+    pool = get_pool()
+    if pool is None:
+        hashers.check_password(password, encoded)
+    else:
+        pool.run(hashers.check_password, password, encoded)
+
+
+def needs_rehash(encoded):
+    """Return whether encoded differs from the preferred hasher's target.
+
+    It is the case when its algorithm isn't the one of the first of
+    `PASSWORD_HASHERS` or when its work factor, e.g. the number of
+    iterations, differs from that hasher's.
+    """
+    try:
+        hasher = hashers.identify_hasher(encoded)
+    except ValueError:
+        return False
+    preferred = hashers.get_hasher('default')
+    return hasher.algorithm != preferred.algorithm or \
+        preferred.must_update(encoded)
+
+
+def check_password(user, password):
+    """Return whether password is the password of user.
+
+    On success the password is transparently hashed again and saved when
+    its hash doesn't match the preferred hasher. The rehash is skipped when
+    the pool is full, a later sign in does it.
+    """
+    pool = get_pool()
+    if pool is None:
+        # User.check_password already rehashes through its setter
+        return user.check_password(password)
+    valid = pool.run(hashers.check_password, password, user.password)
+    if valid and needs_rehash(user.password):
+        encoded = user.password
+        try:
+            set_password(user, password)
+        except HashingUnavailable:
+            user.password = encoded
+        else:
+            user.save(update_fields=['password'])
+    return valid
+
+
+def set_password(user, password):
+    """Hash password and set it on user without saving it."""
+    pool = get_pool()
+    if pool is None:
+        user.set_password(password)
+        return
+    user.password = pool.run(hashers.make_password, password)
+    user._password = password
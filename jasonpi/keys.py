@@ -0,0 +1,142 @@
+"""Keyring signing and verifying jwt tokens.
+
+By default tokens are signed with HS256 and `SECRET_KEY`. Setting
+`JASONPI_JWT_KEYS` to a list of keys enables other algorithms and key
+rotation, e.g.::
+
+    JASONPI_JWT_KEYS = [
+        {'kid': '2018-02', 'algorithm': 'RS256',
+         'private_key': PEM, 'public_key': PEM},
+        {'kid': '2018-01', 'algorithm': 'RS256', 'public_key': PEM},
+    ]
+
+The first key holding a private key (or a `secret` for HMAC algorithms)
+signs new tokens with its `kid` in their header, the others only verify
+tokens issued before a rotation. A keyring of public keys only verifies
+tokens, e.g. on nodes that never issue any. Keys are parsed once per
+process.
+"""
+
+import json
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+import jwt
+from jwt.algorithms import get_default_algorithms
+
+from cryptography.hazmat.primitives.serialization import \
+    load_pem_private_key, \
+    load_pem_public_key
+
+
+def _bytes(value):
+    return value.encode('utf-8') if isinstance(value, str) else value
+
+
+class Key(object):
+    """A signing or verifying key with its parsed key objects."""
+
+    def __init__(self, algorithm, kid=None, private_key=None,
+                 public_key=None, secret=None):
+        self.algorithm = algorithm
+        self.kid = kid
+        self.symmetric = algorithm.startswith('HS')
+        if self.symmetric:
+            self.signing_key = self.verifying_key = _bytes(secret)
+            return
+        self.signing_key = None
+        if private_key is not None:
+            self.signing_key = load_pem_private_key(
+                _bytes(private_key),
+                password=None,
+            )
+        if public_key is not None:
+            self.verifying_key = load_pem_public_key(_bytes(public_key))
+        else:
+            self.verifying_key = self.signing_key.public_key()
+
+    @property
+    def can_sign(self):
+        return self.signing_key is not None
+
+    def jwk(self):
+        """Return the public jwk of the key."""
+        algorithm = get_default_algorithms()[self.algorithm]
+        jwk = json.loads(algorithm.to_jwk(self.verifying_key))
+        jwk.update({'alg': self.algorithm, 'use': 'sig'})
+        if self.kid is not None:
+            jwk['kid'] = self.kid
+        return jwk
+
+
+class Keyring(object):
+    """Sign tokens with the active key and verify them by kid."""
+
+    def __init__(self, keys):
+        self.keys = {key.kid: key for key in keys}
+        self.active = next((key for key in keys if key.can_sign), None)
+
+    def sign(self, payload):
+        if self.active is None:
+            raise ImproperlyConfigured(
+                'JASONPI_JWT_KEYS holds no key able to sign tokens')
+        headers = None
+        if self.active.kid is not None:
+            headers = {'kid': self.active.kid}
+        token = jwt.encode(
+            payload,
+            self.active.signing_key,
+            algorithm=self.active.algorithm,
+            headers=headers,
+        )
+        if isinstance(token, bytes):
+            return token.decode('utf-8')
+        return token
+
+    def verify(self, token):
+        """Return the claims of token, raise an InvalidTokenError if bad."""
+        kid = jwt.get_unverified_header(token).get('kid')
+        try:
+            key = self.keys[kid]
+        except KeyError:
+            raise jwt.InvalidTokenError('Unknown key %s' % kid)
+        return jwt.decode(
+            token,
+            key.verifying_key,
+            algorithms=[key.algorithm],
+        )
+
+    def jwks(self):
+        """Return the public keys as a jwk set."""
+        return {
+            'keys': [
+                key.jwk() for key in self.keys.values() if not key.symmetric
+            ],
+        }
+
+
+_keyring = None
+_lock = threading.Lock()
+
+
+def get_keyring():
+    """Return the keyring configured by `JASONPI_JWT_KEYS`."""
+    global _keyring
+    if _keyring is None:
+        with _lock:
+            if _keyring is None:
+                keys = getattr(settings, 'JASONPI_JWT_KEYS', None)
+                if keys is None:
+                    keys = [{
+                        'algorithm': 'HS256',
+                        'secret': settings.SECRET_KEY,
+                    }]
+                _keyring = Keyring([Key(**key) for key in keys])
+    return _keyring
+
+
+def reset_keyring():
+    global _keyring
+    _keyring = None
@@ -0,0 +1,136 @@
+"""Coalesced writes of `last_login` on sign in.
+
+`update_last_login` only writes the column, and only when the stored value
+is older than `JASONPI_LAST_LOGIN_GRANULARITY`. When
+`JASONPI_LAST_LOGIN_FLUSH_INTERVAL` is set, writes are queued and flushed in
+bulk by a background thread instead.
+"""
+
+import atexit
+import datetime
+import logging
+import threading
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.utils import timezone
+
+from jasonpi.cache import get_user_cache
+
+logger = logging.getLogger(__name__)
+
+
+class LastLoginTracker(object):
+    """Write last_login with targeted, coalesced updates."""
+
+    def __init__(self, granularity, flush_interval=None, batch_size=500):
+        self.granularity = granularity
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.pending = {}
+        self.writes = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def touch(self, user, now=None):
+        """Record a sign in of user, return whether a write is issued."""
+        if now is None:
+            now = timezone.now()
+        if user.last_login is not None and \
+                now - user.last_login < self.granularity:
+            self.skipped += 1
+            return False
+        user.last_login = now
+        if self.flush_interval:
+            with self._lock:
+                self.pending[user.pk] = now
+            self.start()
+        else:
+            user.save(update_fields=['last_login'])
+            self.writes += 1
+        return True
+
+    def flush(self):
+        """Write every pending last_login in bulk."""
+        with self._lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return 0
+        User = get_user_model()
+        User.objects.bulk_update(
+            [User(pk=pk, last_login=now) for pk, now in pending.items()],
+            ['last_login'],
+            batch_size=self.batch_size,
+        )
+        self.writes += 1
+        cache = get_user_cache()
+        if cache is not None:
+            for pk in pending:
+                cache.invalidate(pk)
+        return len(pending)
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self.run,
+                    name='jasonpi-last-login',
+                    daemon=True,
+                )
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def run(self):
+        while not self._stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Unable to flush last_login updates')
+            finally:
+                connection.close()
+
+    def stop(self):
+        """Stop the background thread and flush what is pending."""
+        self._stopped.set()
+        self.flush()
+
+
+_tracker = None
+_lock = threading.Lock()
+
+
+def get_tracker():
+    global _tracker
+    if _tracker is None:
+        with _lock:
+            if _tracker is None:
+                _tracker = LastLoginTracker(
+                    granularity=getattr(
+                        settings,
+                        'JASONPI_LAST_LOGIN_GRANULARITY',
+                        datetime.timedelta(minutes=5),
+                    ),
+                    flush_interval=getattr(
+                        settings,
+                        'JASONPI_LAST_LOGIN_FLUSH_INTERVAL',
+                        None,
+                    ),
+                )
+    return _tracker
+
+
+def reset_tracker():
+    global _tracker
+    if _tracker is not None and _tracker._thread is not None:
+        _tracker.stop()
+    _tracker = None
+
+
+def update_last_login(user, now=None):
+    """Set last_login of user, writing it only when it changes enough."""
+    return get_tracker().touch(user, now)
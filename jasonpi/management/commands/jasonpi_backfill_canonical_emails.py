@@ -0,0 +1,46 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from jasonpi.base import canonical_email
+
+
+class Command(BaseCommand):
+    help = (
+        'Fill the canonical email of users saved before it existed, in '
+        'batches, so that email lookups can use its index.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Users updated per query.',
+        )
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        start = time.perf_counter()
+        count = last_pk = 0
+        while True:
+            users = list(
+                User.objects
+                .filter(pk__gt=last_pk, email_canonical__isnull=True)
+                .order_by('pk')
+                .only('pk', 'email')[:options['batch_size']]
+            )
+            if not users:
+                break
+            for user in users:
+                user.email_canonical = canonical_email(user.email)
+            User.objects.bulk_update(users, ['email_canonical'])
+            count += len(users)
+            last_pk = users[-1].pk
+            if options['verbosity'] > 1:
+                self.stdout.write('%d users' % count)
+        self.stdout.write('Backfilled %d users in %.1fs' % (
+            count,
+            time.perf_counter() - start,
+        ))
@@ -0,0 +1,79 @@
+import math
+import os
+import time
+
+from django.contrib.auth.hashers import get_hashers
+from django.core.management.base import BaseCommand
+
+# the preferred hasher, used for new hashes, is starred
+LINE = '%s%-20s %9.2f ms/hash %10.1f ops/sec/core %10.1f ops/sec'
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the configured password hashers on this machine and '
+        'suggest the work factor matching a target latency.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=1.0,
+            help='Seconds spent benchmarking each hasher.',
+        )
+        parser.add_argument(
+            '--target',
+            type=float,
+            default=None,
+            help='Target hashing latency in milliseconds.',
+        )
+
+    def handle(self, *args, **options):
+        cores = os.cpu_count() or 1
+        self.stdout.write('%d cores' % cores)
+        for index, hasher in enumerate(get_hashers()):
+            salt = hasher.salt()
+            count = 0
+            start = time.perf_counter()
+            elapsed = 0
+            while not count or elapsed < options['duration']:
+                hasher.encode('benchmark-password', salt)
+                count += 1
+                elapsed = time.perf_counter() - start
+            latency = elapsed / count
+            line = LINE % (
+                '*' if index == 0 else ' ',
+                hasher.algorithm,
+                latency * 1000,
+                1 / latency,
+                cores / latency,
+            )
+            factor = self.work_factor(hasher)
+            if factor is not None and options['target']:
+                name, value = factor
+                line += '  %s=%d for %.0f ms' % (
+                    name,
+                    self.suggest(
+                        name, value, options['target'] / (latency * 1000)),
+                    options['target'],
+                )
+            self.stdout.write(line)
+
+    def work_factor(self, hasher):
+        """Return the name and value of the work factor of hasher."""
+        for name in ('iterations', 'rounds', 'time_cost'):
+            if hasattr(hasher, name):
+                return name, getattr(hasher, name)
+        return None
+
+    def suggest(self, name, value, ratio):
+        """Return the value of the work factor name scaling the latency by
+        ratio.
+
+        bcrypt rounds are the log2 of its iterations, the other factors
+        scale linearly.
+        """
+        if name == 'rounds':
+            return max(4, min(31, round(value + math.log2(ratio))))
+        return max(1, round(value * ratio))
@@ -0,0 +1,53 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from jasonpi import bulk
+
+
+class Command(BaseCommand):
+    help = (
+        'Export users and their providers with hashed passwords to a JSON '
+        'lines or CSV file, readable by jasonpi_import_users.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to write, - for stdout.')
+        parser.add_argument(
+            '--format',
+            choices=bulk.FORMATS,
+            default=None,
+            help='File format, guessed from the extension by default.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Users fetched and written per chunk.',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or bulk.guess_format(path)
+        stream = sys.stdout if path == '-' else \
+            open(path, 'w', newline='', encoding='utf-8')
+        start = time.perf_counter()
+        try:
+            count = bulk.write_records(
+                stream,
+                bulk.export_records(options['batch_size']),
+                format,
+            )
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+        seconds = time.perf_counter() - start
+        if stream is not sys.stdout:
+            self.stdout.write(
+                'Exported %d users in %.1fs, %.0f rows/sec' % (
+                    count,
+                    seconds,
+                    count / seconds if seconds else 0,
+                )
+            )
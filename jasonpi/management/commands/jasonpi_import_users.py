@@ -0,0 +1,59 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from jasonpi import bulk
+
+
+class Command(BaseCommand):
+    help = (
+        'Import users and their providers from a JSON lines or CSV file '
+        'with hashed passwords, in batches inserted with bulk_create. '
+        'Users whose email already exists are skipped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, - for stdin.')
+        parser.add_argument(
+            '--format',
+            choices=bulk.FORMATS,
+            default=None,
+            help='File format, guessed from the extension by default.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Users inserted per transaction.',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or bulk.guess_format(path)
+        stream = sys.stdin if path == '-' else \
+            open(path, newline='', encoding='utf-8')
+        try:
+            stats = bulk.import_users(
+                bulk.read_records(stream, format),
+                batch_size=options['batch_size'],
+                callback=self.progress if options['verbosity'] > 1 else None,
+            )
+        except (bulk.RecordError, ValueError) as e:
+            raise CommandError(str(e))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        self.stdout.write(
+            'Imported %(users)d users and %(providers)d providers from '
+            '%(rows)d rows in %(seconds).1fs' % stats +
+            ', %.0f rows/sec' % self.rate(stats)
+        )
+
+    def rate(self, stats):
+        return stats['rows'] / stats['seconds'] if stats['seconds'] else 0
+
+    def progress(self, stats):
+        self.stdout.write('%d rows, %.0f rows/sec' % (
+            stats['rows'],
+            self.rate(stats),
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from jasonpi.bloom import get_email_filter
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the bloom filter of registered emails and share it with '
+        'every process through the JASONPI_EMAIL_FILTER_CACHE cache.'
+    )
+
+    def handle(self, *args, **options):
+        email_filter = get_email_filter()
+        if email_filter is None:
+            raise CommandError('JASONPI_EMAIL_FILTER is not enabled.')
+        if email_filter.cache is None:
+            self.stderr.write(
+                'JASONPI_EMAIL_FILTER_CACHE is not set, the filter is only '
+                'rebuilt in this process.'
+            )
+        bloom, built = email_filter.store()
+        self.stdout.write('Stored %d bytes, %d hashes, built at %s' % (
+            len(bloom.bits),
+            bloom.hashes,
+            built.isoformat(),
+        ))
@@ -0,0 +1,64 @@
+"""Minimal in-process metrics, exported with `snapshot`."""
+
+import threading
+import time
+from contextlib import contextmanager
+
+_lock = threading.Lock()
+_timings = {}
+_gauges = {}
+_counters = {}
+
+
+def observe(name, seconds):
+    """Record a duration for the timing called name."""
+    with _lock:
+        timing = _timings.setdefault(name, {
+            'count': 0,
+            'total': 0.0,
+            'max': 0.0,
+            'last': 0.0,
+        })
+        timing['count'] += 1
+        timing['total'] += seconds
+        timing['max'] = max(timing['max'], seconds)
+        timing['last'] = seconds
+
+
+@contextmanager
+def timer(name):
+    """Time the enclosed block as the timing called name."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def gauge(name, value):
+    """Set the current value of the gauge called name."""
+    with _lock:
+        _gauges[name] = value
+
+
+def incr(name, value=1):
+    """Increment the counter called name."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def snapshot():
+    """Return a copy of every timing, gauge and counter."""
+    with _lock:
+        return {
+            'timings': {k: dict(v) for k, v in _timings.items()},
+            'gauges': dict(_gauges),
+            'counters': dict(_counters),
+        }
+
+
+def reset():
+    with _lock:
+        _timings.clear()
+        _gauges.clear()
+        _counters.clear()
@@ -1,5 +1,6 @@
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.utils import timezone
 
 
 class Provider(models.Model):
@@ -13,3 +14,39 @@ class Provider(models.Model):
 
     class Meta:
         unique_together = (('uid', 'provider'), )
+
+
+class RefreshToken(models.Model):
+    """Refresh token stored as the sha256 digest of its value."""
+
+    user = models.ForeignKey(
+        get_user_model(),
+        on_delete=models.CASCADE,
+        related_name='refresh_tokens',
+    )
+    token_hash = models.CharField(max_length=64, unique=True)
+    family = models.UUIDField(db_index=True)
+    expires_at = models.DateTimeField()
+    used_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+
+class RevokedToken(models.Model):
+    """Revocation of one access token by jti, or of every access token of
+    a user issued before `issued_before`.
+
+    Rows are useless once `expires_at` passes, as the tokens they cover
+    have expired.
+    """
+
+    jti = models.CharField(max_length=64, null=True, blank=True)
+    user = models.ForeignKey(
+        get_user_model(),
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='+',
+    )
+    issued_before = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
@@ -0,0 +1,211 @@
+"""Bounded verification of social provider access tokens.
+
+Provider APIs are called with blocking urllib3 requests, either on the
+request thread through `verify` or on a shared thread pool through
+`verify_all`. Connections are pooled per provider, and each provider has its
+own timeout and concurrency limit: a call holds a slot of its provider
+until its request is over, and waits up to the timeout for a free slot.
+"""
+
+import concurrent.futures
+import json
+import threading
+
+from django.conf import settings
+from django.utils.translation import ugettext_lazy as _
+
+import urllib3
+
+from rest_framework import exceptions
+
+from jasonpi.normalizers import facebook_profile, google_profile
+
+DEFAULTS = {
+    'google': {
+        'url': 'https://people.googleapis.com/v1/people/me',
+        'timeout': 5,
+        'concurrency': 10,
+    },
+    'facebook': {
+        'url': 'https://graph.facebook.com/v2.8/me',
+        'timeout': 5,
+        'concurrency': 10,
+    },
+}
+
+
+class ProviderUnavailable(exceptions.APIException):
+    status_code = 503
+    default_detail = _('The provider could not be reached, try again later.')
+    default_code = 'provider_unavailable'
+
+
+class ProviderClient(object):
+    """Call a provider API to fetch the profile behind an access token."""
+
+    name = None
+
+    def __init__(self, url, timeout, concurrency):
+        self.url = url
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.pool = urllib3.PoolManager(maxsize=concurrency, block=True)
+        self.slots = threading.BoundedSemaphore(concurrency)
+
+    def request_kwargs(self, access_token):
+        raise NotImplementedError
+
+    def profile(self, data, uid):
+        raise NotImplementedError
+
+    def fetch(self, access_token):
+        """Run the blocking http call."""
+        response = self.pool.request(
+            'GET',
+            self.url,
+            timeout=urllib3.Timeout(total=self.timeout),
+            retries=False,
+            **self.request_kwargs(access_token)
+        )
+        if response.status != 200:
+            raise exceptions.ValidationError(_('Invalid access token'))
+        return json.loads(response.data.decode('utf-8'))
+
+    def verify(self, access_token, uid):
+        """Return the normalized profile of the user owning access_token."""
+        if not self.slots.acquire(timeout=self.timeout):
+            raise ProviderUnavailable()
+        try:
+            data = self.fetch(access_token)
+        except urllib3.exceptions.HTTPError:
+            raise ProviderUnavailable()
+        finally:
+            self.slots.release()
+        return self.profile(data, uid)
+
+
+class GoogleClient(ProviderClient):
+    name = 'google'
+
+    def request_kwargs(self, access_token):
+        return {
+            'fields': {
+                'personFields':
+                    'addresses,emailAddresses,names,genders,birthdays',
+            },
+            'headers': {'Authorization': 'Bearer %s' % access_token},
+        }
+
+    def profile(self, data, uid):
+        if data['resourceName'].split('/')[1] != uid:
+            raise exceptions.ValidationError(
+                _('Google user id doesn\'t match'))
+        return google_profile(data)
+
+
+class FacebookClient(ProviderClient):
+    name = 'facebook'
+
+    def request_kwargs(self, access_token):
+        return {
+            'fields': {
+                'fields':
+                    'picture,first_name,last_name,name,birthday,gender,email',
+                'access_token': access_token,
+            },
+        }
+
+    def profile(self, data, uid):
+        if data['id'] != uid:
+            raise exceptions.ValidationError(
+                _('Facebook user id doesn\'t match'))
+        return facebook_profile(data)
+
+
+CLIENTS = {
+    'google': GoogleClient,
+    'facebook': FacebookClient,
+}
+
+
+class ProviderPool(object):
+    """Provider clients and the thread pool verifying tokens in batches."""
+
+    def __init__(self):
+        self.executor = None
+        self.clients = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self.clients is not None:
+                return
+            clients = {
+                name: cls(**options(name)) for name, cls in CLIENTS.items()
+            }
+            self.executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=sum(c.concurrency for c in clients.values()),
+                thread_name_prefix='jasonpi-providers',
+            )
+            self.clients = clients
+
+    def stop(self):
+        """Drop the clients, they are created again on the next call."""
+        with self._lock:
+            if self.clients is None:
+                return
+            self.executor.shutdown(wait=False)
+            self.executor = self.clients = None
+
+    def verify(self, provider, access_token, uid):
+        self.start()
+        try:
+            client = self.clients[provider]
+        except KeyError:
+            raise exceptions.ValidationError(_('Provider not supported'))
+        return client.verify(access_token, uid)
+
+    def verify_all(self, tokens):
+        self.start()
+        futures = [
+            self.executor.submit(self.verify, *token) for token in tokens
+        ]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+pool = ProviderPool()
+
+
+def reset_providers():
+    pool.stop()
+
+
+def options(name):
+    result = dict(DEFAULTS[name])
+    result.update(getattr(settings, 'JASONPI_PROVIDERS', {}).get(name, {}))
+    return result
+
+
+def is_async():
+    """Return whether providers are verified through the bounded clients."""
+    return getattr(settings, 'JASONPI_ASYNC_PROVIDERS', False)
+
+
+def verify(provider, access_token, uid):
+    """Return the profile of uid, checked with the provider's api."""
+    return pool.verify(provider, access_token, uid)
+
+
+def verify_all(tokens):
+    """Verify (provider, access_token, uid) tuples concurrently.
+
+    Return a list holding either the profile or the raised exception for
+    each tuple.
+    """
+    return pool.verify_all(list(tokens))
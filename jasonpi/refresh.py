@@ -0,0 +1,93 @@
+"""Rotating refresh tokens.
+
+A refresh token is a random string handed to the client once and stored as
+its sha256 digest. Refreshing looks the digest up through its unique index,
+marks the token used and issues the next token of the same family. Using a
+token twice means it leaked, so the whole family is revoked.
+"""
+
+import datetime
+import hashlib
+import secrets
+import uuid
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+
+from rest_framework import exceptions
+
+from jasonpi.models import RefreshToken
+
+
+def is_enabled():
+    """Return whether sign ins issue refresh tokens."""
+    return getattr(settings, 'JASONPI_REFRESH_TOKENS', False)
+
+
+def digest(token):
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def issue_refresh_token(user, family=None):
+    """Store a new refresh token for user and return its value."""
+    token = secrets.token_urlsafe(32)
+    RefreshToken.objects.create(
+        user=user,
+        token_hash=digest(token),
+        family=family or uuid.uuid4(),
+        expires_at=timezone.now() + getattr(
+            settings,
+            'JASONPI_REFRESH_TOKEN_DURATION',
+            datetime.timedelta(days=30),
+        ),
+    )
+    return token
+
+
+def rotate_refresh_token(token):
+    """Consume token and return its user with the next refresh token."""
+    invalid = exceptions.AuthenticationFailed(_('Invalid refresh token'))
+    if not isinstance(token, str):
+        raise invalid
+    try:
+        refresh_token = RefreshToken.objects.select_related('user') \
+            .get(token_hash=digest(token))
+    except RefreshToken.DoesNotExist:
+        raise invalid
+    now = timezone.now()
+    if refresh_token.expires_at <= now or not refresh_token.user.is_active:
+        raise invalid
+    # the update only matches once, even for concurrent refreshes
+    used = RefreshToken.objects \
+        .filter(pk=refresh_token.pk, used_at__isnull=True) \
+        .update(used_at=now)
+    if not used:
+        revoke_family(refresh_token.family)
+        raise invalid
+    user = refresh_token.user
+    return user, issue_refresh_token(user, refresh_token.family)
+
+
+def revoke_family(family):
+    """Mark every token of family used, so that none can be refreshed."""
+    RefreshToken.objects \
+        .filter(family=family, used_at__isnull=True) \
+        .update(used_at=timezone.now())
+
+
+def revoke_user_refresh_tokens(user):
+    """Mark every token of user used, e.g. when all their sessions end."""
+    RefreshToken.objects \
+        .filter(user=user, used_at__isnull=True) \
+        .update(used_at=timezone.now())
+
+
+def revoke_refresh_token(token):
+    """Revoke the family of token, e.g. when signing out."""
+    family = RefreshToken.objects \
+        .filter(token_hash=digest(token)) \
+        .values_list('family', flat=True) \
+        .first()
+    if family is not None:
+        revoke_family(family)
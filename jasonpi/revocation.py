@@ -0,0 +1,213 @@
+"""Revocation of access tokens before they expire.
+
+Tokens are revoked one by one through their `jti` claim, or all the tokens
+of a user issued before a point in time through a watermark. Revocations
+are stored in the database and mirrored in every process by a
+`RevocationList`, so that checking a token never queries the database: the
+list fetches the rows created since its last sync at most every
+`sync_interval` seconds, and forgets entries once the tokens they cover
+have expired. Rows are fetched by creation time with an overlap, so that
+rows committed a little after they were created aren't missed.
+"""
+
+import datetime
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from jasonpi.models import RevokedToken
+
+
+def token_duration():
+    return getattr(
+        settings,
+        'JASONPI_TOKEN_DURATION',
+        datetime.timedelta(days=1),
+    )
+
+
+class RevocationList(object):
+    """In-process copy of the revoked jtis and per-user watermarks."""
+
+    # seconds between the creation of a row and its commit still caught by
+    # the next sync
+    sync_overlap = 60
+
+    def __init__(self, sync_interval=5, rebuild_interval=3600):
+        self.sync_interval = sync_interval
+        self.rebuild_interval = rebuild_interval
+        # jti -> exp and user id -> (issued before, exp), as timestamps
+        self.jtis = {}
+        self.watermarks = {}
+        # rows created before synced_through are in the list
+        self.synced_through = None
+        self.synced_at = self.built_at = None
+        # revocations of this process made while a sync runs
+        self.syncing = False
+        self.pending = []
+        self.built = threading.Event()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def record(jtis, watermarks, revocation):
+        expires_at = revocation.expires_at.timestamp()
+        if revocation.jti is not None:
+            jtis[revocation.jti] = expires_at
+        if revocation.user_id is not None:
+            issued_before = revocation.issued_before.timestamp()
+            current = watermarks.get(revocation.user_id)
+            if current is None or current[0] < issued_before:
+                watermarks[revocation.user_id] = (issued_before, expires_at)
+
+    def add(self, revocation):
+        with self._lock:
+            self.record(self.jtis, self.watermarks, revocation)
+            if self.syncing:
+                self.pending.append(revocation)
+
+    def prune(self, now):
+        self.jtis = {
+            jti: exp for jti, exp in self.jtis.items() if exp > now
+        }
+        self.watermarks = {
+            user_id: watermark
+            for user_id, watermark in self.watermarks.items()
+            if watermark[1] > now
+        }
+
+    def needs_rebuild(self, now):
+        return self.built_at is None or \
+            now - self.built_at > self.rebuild_interval
+
+    def needs_sync(self, now):
+        return self.needs_rebuild(now) or \
+            now - self.synced_at > self.sync_interval
+
+    def sync(self):
+        """Bring the list up to date unless another thread is at it.
+
+        The queries run without the lock, the other threads keep using the
+        current list meanwhile and only wait for the first build.
+        """
+        while self.needs_sync(time.monotonic()):
+            with self._lock:
+                now = time.monotonic()
+                if not self.needs_sync(now):
+                    return
+                claimed = not self.syncing
+                if claimed:
+                    self.syncing = True
+                    if self.built_at is None:
+                        self.built.clear()
+                    rebuild = self.needs_rebuild(now)
+                    if rebuild:
+                        jtis, watermarks = {}, {}
+                    else:
+                        jtis = dict(self.jtis)
+                        watermarks = dict(self.watermarks)
+            if claimed:
+                self.update(now, rebuild, jtis, watermarks)
+                return
+            if self.built_at is not None:
+                return
+            # nothing to check tokens against before the first build
+            self.built.wait()
+
+    def update(self, now, rebuild, jtis, watermarks):
+        try:
+            synced_through = timezone.now()
+            if rebuild:
+                # expired rows are dropped with each rebuild
+                RevokedToken.objects \
+                    .filter(expires_at__lte=synced_through) \
+                    .delete()
+                revocations = RevokedToken.objects.all()
+            else:
+                revocations = RevokedToken.objects.filter(
+                    created_at__gte=self.synced_through - datetime.timedelta(
+                        seconds=self.sync_overlap),
+                )
+            for revocation in revocations.iterator():
+                self.record(jtis, watermarks, revocation)
+            with self._lock:
+                self.jtis, self.watermarks = jtis, watermarks
+                for revocation in self.pending:
+                    self.record(jtis, watermarks, revocation)
+                self.prune(time.time())
+                if rebuild:
+                    self.built_at = now
+                self.synced_through = synced_through
+                self.synced_at = now
+        finally:
+            with self._lock:
+                self.syncing = False
+                self.pending = []
+            self.built.set()
+
+    def is_revoked(self, payload):
+        """Return whether the token with the verified claims is revoked."""
+        self.sync()
+        if payload.get('jti') in self.jtis:
+            return True
+        watermark = self.watermarks.get(payload.get('user_id'))
+        if watermark is None:
+            return False
+        # tokens without iat predate the watermarks
+        return payload.get('iat', 0) <= watermark[0]
+
+    def revoke(self, payload):
+        """Revoke the token with the verified claims until it expires."""
+        revocation = RevokedToken.objects.create(
+            jti=payload['jti'],
+            expires_at=datetime.datetime.fromtimestamp(
+                payload['exp'],
+                datetime.timezone.utc,
+            ),
+        )
+        self.add(revocation)
+
+    def revoke_user(self, user_id, issued_before=None):
+        """Revoke the tokens of user issued up to issued_before, now by
+        default."""
+        if issued_before is None:
+            issued_before = timezone.now()
+        revocation = RevokedToken.objects.create(
+            user_id=user_id,
+            issued_before=issued_before,
+            expires_at=issued_before + token_duration(),
+        )
+        self.add(revocation)
+
+
+_revocation_list = None
+_lock = threading.Lock()
+
+
+def get_revocation_list():
+    """Return the revocation list or None when revocation is disabled."""
+    global _revocation_list
+    if not getattr(settings, 'JASONPI_TOKEN_REVOCATION', False):
+        return None
+    if _revocation_list is None:
+        with _lock:
+            if _revocation_list is None:
+                _revocation_list = RevocationList(
+                    sync_interval=getattr(
+                        settings,
+                        'JASONPI_TOKEN_REVOCATION_SYNC_INTERVAL',
+                        5,
+                    ),
+                    rebuild_interval=getattr(
+                        settings,
+                        'JASONPI_TOKEN_REVOCATION_REBUILD_INTERVAL',
+                        3600,
+                    ),
+                )
+    return _revocation_list
+
+
+def reset_revocation_list():
+    global _revocation_list
+    _revocation_list = None
@@ -0,0 +1,245 @@
+"""Shared S3 client, upload key validation and limits for the S3 views.
+
+Creating a boto3 client loads the service model, resolves credentials and
+builds the endpoint, so one client is created per process on first use and
+shared by every thread. Credentials that botocore can refresh, e.g. those
+of an instance role or an assumed role, are refreshed by the client itself;
+setting `JASONPI_S3_CLIENT_MAX_AGE` also recreates the client periodically
+to pick up rotated static credentials.
+"""
+
+import base64
+import collections
+import hmac
+import json
+import os
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.translation import ugettext_lazy as _
+
+import boto3
+
+from rest_framework import exceptions
+
+KEY_REGEX = re.compile(
+    r'u?(?P<user_id>[0-9]+)/(?P<category>assets|misc)/'
+    r'[0-9]{4}-[0-9]{2}-[0-9]{2}_[0-9a-z-]+\.[^\.]+'
+)
+
+
+def validate_key(key, user_id):
+    """Return the match of key, raise a ValidationError unless key is an
+    upload key of user_id."""
+    match = KEY_REGEX.match(key)
+    if match is None or user_id is None or \
+            match.group('user_id') != str(user_id):
+        raise exceptions.ValidationError({'error': _('Wrong S3 Key')})
+    return match
+
+
+UPLOAD_LIMITS = {
+    'assets': {
+        'min_size': 1,
+        'max_size': 10 * 1024 * 1024,
+        'content_type': 'image/',
+    },
+    'misc': {
+        'min_size': 1,
+        'max_size': 10 * 1024 * 1024,
+        'content_type': '',
+    },
+}
+
+
+def upload_limits(category):
+    """Return the limits of uploads in category, `JASONPI_S3_UPLOAD_LIMITS`
+    overriding the defaults."""
+    limits = dict(UPLOAD_LIMITS.get(category, UPLOAD_LIMITS['misc']))
+    limits.update(
+        getattr(settings, 'JASONPI_S3_UPLOAD_LIMITS', {}).get(category, {}))
+    return limits
+
+
+def post_conditions(limits, content_type=None):
+    """Return the fields and policy conditions of a presigned post.
+
+    S3 refuses uploads whose size or content type break the limits.
+    """
+    prefix = limits['content_type']
+    if prefix and (content_type is None or not content_type.startswith(
+            prefix)):
+        raise exceptions.ValidationError(
+            {'error': _('contentType must start with %s') % prefix})
+    fields = {'acl': 'public-read'}
+    conditions = [
+        {'acl': 'public-read'},
+        ['content-length-range', limits['min_size'], limits['max_size']],
+    ]
+    if content_type is not None:
+        fields['Content-Type'] = content_type
+        conditions.append(['starts-with', '$Content-Type', prefix])
+    return fields, conditions
+
+
+class ClientFactory(object):
+    """Create the S3 client lazily and share it between threads."""
+
+    def __init__(self, max_age=None, **client_kwargs):
+        self.max_age = max_age
+        self.client_kwargs = client_kwargs
+        self.client = None
+        self.created_at = None
+        self._lock = threading.Lock()
+
+    def expired(self):
+        return self.max_age is not None and \
+            time.monotonic() - self.created_at > self.max_age
+
+    def get(self):
+        client = self.client
+        if client is None or self.expired():
+            with self._lock:
+                if self.client is None or self.expired():
+                    # sessions aren't thread safe, each client gets its own
+                    session = boto3.session.Session()
+                    self.client = session.client('s3', **self.client_kwargs)
+                    self.created_at = time.monotonic()
+                client = self.client
+        return client
+
+
+class S3Signer(object):
+    """Sign upload policies and chunk headers with V2 or V4 signatures.
+
+    The secret is encoded once, and V4 signing keys, which are valid for a
+    date, region and service, are derived once per scope.
+    """
+
+    max_signing_keys = 8
+
+    def __init__(self, secret_key):
+        self.secret_key = secret_key
+        self.secret = secret_key.encode('utf-8')
+        self.signing_keys = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def sign_v2(self, string_to_sign):
+        return base64.b64encode(
+            hmac.digest(self.secret, string_to_sign, 'sha1'),
+        ).decode('utf-8')
+
+    def signing_key(self, scope):
+        """Return the V4 key of scope, a (date, region, service) tuple."""
+        key = self.signing_keys.get(scope)
+        if key is None:
+            key = ('AWS4' + self.secret_key).encode('utf-8')
+            for part in scope + ('aws4_request', ):
+                key = hmac.digest(key, part.encode('utf-8'), 'sha256')
+            with self._lock:
+                self.signing_keys[scope] = key
+                # scopes change daily, only the last few are kept
+                while len(self.signing_keys) > self.max_signing_keys:
+                    self.signing_keys.popitem(last=False)
+        return key
+
+    def sign_v4(self, string_to_sign, scope):
+        return hmac.digest(
+            self.signing_key(scope),
+            string_to_sign,
+            'sha256',
+        ).hex()
+
+    def sign_headers(self, headers):
+        """Sign the string to sign of a chunk upload.
+
+        V4 strings start with the algorithm, then hold the request date and
+        the `date/region/service/aws4_request` scope.
+        """
+        if headers.startswith('AWS4-HMAC-SHA256\n'):
+            lines = headers.split('\n', 3)
+            scope = tuple(lines[2].split('/')[:3]) if len(lines) > 2 else ()
+            if len(scope) != 3:
+                raise ValueError('Invalid scope')
+            signature = self.sign_v4(headers.encode('utf-8'), scope)
+        else:
+            signature = self.sign_v2(headers.encode('utf-8'))
+        return {'signature': signature}
+
+    def sign_policy_document(self, policy_document):
+        """Sign a post policy, with V4 when it holds an
+        `x-amz-algorithm` condition of `AWS4-HMAC-SHA256`."""
+        policy = base64.b64encode(
+            json.dumps(policy_document).encode('utf-8'))
+        conditions = {}
+        for condition in policy_document.get('conditions', ()):
+            if isinstance(condition, dict):
+                conditions.update(condition)
+        if conditions.get('x-amz-algorithm') == 'AWS4-HMAC-SHA256':
+            # the credential is key id/date/region/service/aws4_request
+            scope = tuple(
+                conditions.get('x-amz-credential', '').split('/')[1:4])
+            if len(scope) != 3:
+                raise ValueError('Invalid credential')
+            signature = self.sign_v4(policy, scope)
+        else:
+            signature = self.sign_v2(policy)
+        return {
+            'policy': policy.decode('utf-8'),
+            'signature': signature,
+        }
+
+
+_signer = None
+
+
+def get_signer():
+    """Return the signer of the `AWS_SECRET_ACCESS_KEY` environment
+    variable, read once per process; call `reset_signer` after rotating
+    it."""
+    global _signer
+    signer = _signer
+    if signer is None:
+        secret_key = os.environ.get('AWS_SECRET_ACCESS_KEY')
+        if secret_key is None:
+            raise ImproperlyConfigured('AWS_SECRET_ACCESS_KEY is not set')
+        signer = _signer = S3Signer(secret_key)
+    return signer
+
+
+def reset_signer():
+    global _signer
+    _signer = None
+
+
+_factory = None
+_lock = threading.Lock()
+
+
+def get_factory():
+    global _factory
+    if _factory is None:
+        with _lock:
+            if _factory is None:
+                _factory = ClientFactory(
+                    max_age=getattr(
+                        settings,
+                        'JASONPI_S3_CLIENT_MAX_AGE',
+                        None,
+                    ),
+                    **getattr(settings, 'JASONPI_S3_CLIENT_KWARGS', {})
+                )
+    return _factory
+
+
+def get_client():
+    """Return the S3 client shared by the process."""
+    return get_factory().get()
+
+
+def reset_client():
+    global _factory
+    _factory = None
@@ -1,10 +1,14 @@
 from datetime import datetime, timezone
+import copy
+import hashlib
 import httplib2
 
 from django.contrib.auth import get_user_model
 from django.contrib.auth.models import Group
 import django.contrib.auth.password_validation as validators
 from django.core import exceptions as core_exceptions
+from django.db import IntegrityError, transaction
+from django.db.models import Model
 from django.utils.translation import ugettext_lazy as _
 from rest_framework import exceptions
 
@@ -14,10 +18,12 @@ from rest_framework_json_api.relations import ResourceRelatedField
 from oauth2client.client import \
     AccessTokenCredentials, \
     AccessTokenCredentialsError
-from googleapiclient.discovery import build
-
 import facebook
 
+from jasonpi import discovery, hashing, providers
+from jasonpi.base import canonical_email
+from jasonpi.cache import get_profile_cache
+from jasonpi.last_login import update_last_login
 from jasonpi.models import Provider
 from jasonpi.normalizers import facebook_profile, google_profile
 
@@ -42,9 +48,15 @@ class GroupSerializer(serializers.HyperlinkedModelSerializer):
 
 class ProviderSerializer(serializers.HyperlinkedModelSerializer):
     access_token = serializers.CharField(max_length=1025, write_only=True)
+    expires_in = serializers.IntegerField(
+        write_only=True,
+        required=False,
+        min_value=0,
+    )
 
     def __init__(self, *args, **kwargs):
         self.user = None
+        self.provider_instance = None
         if 'context' in kwargs and \
                 'request' in kwargs['context'] and \
                 hasattr(kwargs['context']['request'], 'user'):
@@ -54,6 +66,8 @@ class ProviderSerializer(serializers.HyperlinkedModelSerializer):
         super(ProviderSerializer, self).__init__(*args, **kwargs)
 
     def validate_google(self, access_token, uid):
+        if providers.is_async():
+            return providers.verify('google', access_token, uid)
         try:
             credential = AccessTokenCredentials(
                 access_token,
@@ -63,11 +77,10 @@ class ProviderSerializer(serializers.HyperlinkedModelSerializer):
             raise exceptions.ValidationError(_('Invalid access token'))
         http = httplib2.Http()
         http = credential.authorize(http)
-        service = build("people", "v1", http=http)
-        user = service.people().get(
+        user = discovery.get_service().people().get(
             resourceName='people/me',
             personFields='addresses,emailAddresses,names,genders,birthdays'
-        ).execute()
+        ).execute(http=http)
         user_id = user['resourceName'].split('/')[1]
         if uid != user_id:
             raise exceptions.ValidationError(
@@ -75,6 +88,8 @@ class ProviderSerializer(serializers.HyperlinkedModelSerializer):
         return google_profile(user)
 
     def validate_facebook(self, access_token, uid):
+        if providers.is_async():
+            return providers.verify('facebook', access_token, uid)
         graph = facebook.GraphAPI(access_token=access_token)
         user = graph.get_object(
             id='me',
@@ -88,79 +103,137 @@ class ProviderSerializer(serializers.HyperlinkedModelSerializer):
     def get_unique_together_validators(self):
         return []
 
-    def validate(self, data):
-        access_token = data.get('access_token')
-        uid = data.get('uid')
-        provider = data.get('provider')
+    def verify(self, provider, access_token, uid, expires_in=None):
+        """Return the profile of uid, reusing recently verified profiles.
+
+        Profiles are cached by provider, uid and digest of the access token
+        for `JASONPI_PROVIDER_CACHE_TTL` seconds at most, and never beyond
+        the expiry of the access token when the client sends it.
+        """
+        cache = get_profile_cache()
+        if cache is not None:
+            key = (
+                provider,
+                uid,
+                hashlib.sha256(access_token.encode('utf-8')).hexdigest(),
+            )
+            profile = cache.get(key)
+            if profile is not None:
+                return dict(profile)
         if provider == 'google':
             profile = self.validate_google(access_token, uid)
         elif provider == 'facebook':
             profile = self.validate_facebook(access_token, uid)
         else:
             raise exceptions.ValidationError(_('Provider not supported'))
+        if cache is not None:
+            timeout = cache.timeout
+            if expires_in is not None:
+                timeout = min(timeout, expires_in)
+            if timeout > 0:
+                cache.set(key, dict(profile), timeout=timeout)
+        return profile
+
+    def validate(self, data):
+        access_token = data.get('access_token')
+        uid = data.get('uid')
+        provider = data.get('provider')
+        profile = self.verify(
+            provider,
+            access_token,
+            uid,
+            data.get('expires_in'),
+        )
         data['profile'] = profile
+        self.provider_instance = Provider.objects.select_related('user') \
+            .filter(uid=uid, provider=provider).first()
         if self.user is None:
             return super(ProviderSerializer, self).validate(data)
-        try:
-            pu = Provider.objects.get(
-                uid=uid,
-                provider=provider,
+        if self.provider_instance is not None and \
+                self.provider_instance.user_id != self.user.pk:
+            raise exceptions.ValidationError(
+                _('The social account you\'re to trying to use '
+                  'is already linked to another user.')
+            )
+        email_user = self.get_email_user(profile['email'])
+        if email_user is not None and email_user != self.user:
+            raise exceptions.ValidationError(
+                _('The email address for this social account is used by '
+                  'another user.')
             )
-            if pu.user != self.user:
-                pass
-                raise exceptions.ValidationError(
-                    _('The social account you\'re to trying to use '
-                      'is already linked to another user.')
-                )
-        except Provider.DoesNotExist:
-            pass
-        try:
-            email_user = User.objects.get(email=profile['email'])
-            if email_user != self.user:
-                raise exceptions.ValidationError(
-                    _('The email address for this social account is used by '
-                      'another user.')
-                )
-        except User.DoesNotExist:
-            pass
         return super(ProviderSerializer, self).validate(data)
 
-    def save(self):
-        current_user = self.user
+    def get_email_user(self, email):
+        """Return the user owning email, looked up at most once."""
+        if not hasattr(self, '_email_user'):
+            if self.user is not None and \
+                    canonical_email(self.user.email) == canonical_email(email):
+                self._email_user = self.user
+            else:
+                try:
+                    self._email_user = User.objects.get_by_email(email)
+                except User.DoesNotExist:
+                    self._email_user = None
+        return self._email_user
+
+    def save(self, **kwargs):
+        """Log in or link the social account with a single user write.
+
+        kwargs are set on the user before it is written, e.g. last_login,
+        which is coalesced by `update_last_login` for existing accounts.
+        When a concurrent first login wins the race on the unique
+        constraints, the account it created is used instead.
+        """
         profile = self.validated_data['profile']
         uid = self.validated_data['uid']
         provider = self.validated_data['provider']
 
-        try:
-            up = Provider.objects.get(
-                uid=uid,
-                provider=provider
-            )
-            self.instance = up.user
-            return
-        except Provider.DoesNotExist:
-            pass
-
-        if current_user:
-            user = current_user
-        else:
+        for attempt in range(2):
+            if self.provider_instance is not None:
+                user = self.provider_instance.user
+                if 'last_login' in kwargs:
+                    update_last_login(user, kwargs.pop('last_login'))
+                if kwargs:
+                    for key, value in kwargs.items():
+                        setattr(user, key, value)
+                    user.save(update_fields=list(kwargs))
+                self.instance = user
+                return
+            user = self.user or self.get_email_user(profile['email'])
+            if user is None:
+                user = User(**init_kwargs(User, profile))
+            assign(user, profile)
+            for key, value in kwargs.items():
+                setattr(user, key, value)
             try:
-                user = User.objects.get(email=profile['email'])
-            except User.DoesNotExist:
-                kwargs = init_kwargs(User, profile)
-                user = User(**kwargs)
-        assign(user, profile)
-        user.save()
-        Provider.objects.create(
-            user=user,
-            uid=uid,
-            provider=provider
-        )
-        self.instance = user
+                with transaction.atomic():
+                    user.save()
+                    Provider.objects.create(
+                        user=user,
+                        uid=uid,
+                        provider=provider
+                    )
+            except IntegrityError:
+                if attempt:
+                    raise
+                self.provider_instance = Provider.objects \
+                    .select_related('user') \
+                    .filter(uid=uid, provider=provider).first()
+                self.__dict__.pop('_email_user', None)
+                if self.user is not None and \
+                        self.provider_instance is not None and \
+                        self.provider_instance.user_id != self.user.pk:
+                    raise exceptions.ValidationError(
+                        _('The social account you\'re to trying to use '
+                          'is already linked to another user.')
+                    )
+                continue
+            self.instance = user
+            return
 
     class Meta:
         model = Provider
-        fields = ('url', 'uid', 'provider', 'access_token')
+        fields = ('url', 'uid', 'provider', 'access_token', 'expires_in')
 
 
 class UserSerializer(serializers.HyperlinkedModelSerializer):
@@ -181,6 +254,11 @@ class UserSerializer(serializers.HyperlinkedModelSerializer):
         'providers': ProviderSerializer,
     }
 
+    prefetch_for_includes = {
+        'groups': ['groups'],
+        'providers': ['providers'],
+    }
+
     password = serializers.CharField(write_only=True)
     old_password = serializers.CharField(write_only=True, required=False)
 
@@ -203,8 +281,10 @@ class UserSerializer(serializers.HyperlinkedModelSerializer):
             errors['password'] = list(e.messages)
         except Exception as e:
             raise e
-        if self.instance and \
-                not self.instance.check_password(data.get('old_password')):
+        if self.instance and not hashing.check_password(
+                self.instance,
+                data.get('old_password'),
+        ):
             errors['old_password'] = _('Old password isn\'t valid.')
 
         if errors:
@@ -215,7 +295,7 @@ class UserSerializer(serializers.HyperlinkedModelSerializer):
     def create(self, validated_data):
         user = User(**validated_data)
         user.last_login = datetime.now(timezone.utc)
-        user.set_password(validated_data['password'])
+        hashing.set_password(user, validated_data['password'])
         user.save()
         return user
 
@@ -223,38 +303,60 @@ class UserSerializer(serializers.HyperlinkedModelSerializer):
         instance = super(UserSerializer, self).update(instance, validated_data)
         password = validated_data.get('password')
         if password is not None:
-            instance.set_password(password)
+            hashing.set_password(instance, password)
             instance.save()
         return instance
 
     def get_root_meta(self, resource, many):
         if hasattr(self, 'token'):
-            return {
+            meta = {
                 'access_token': self.token
             }
+            if hasattr(self, 'refresh_token'):
+                meta['refresh_token'] = self.refresh_token
+            return meta
         elif many:
             return {
                 'size': len(resource)
             }
         return {}
 
-    def get_fields(self):
-        fields = super(UserSerializer, self).get_fields()
-        limited_fields = getattr(self.Meta, 'limited_fields', fields)
-        request = self.context.get('request', None)
+    def is_limited(self):
+        """Return whether only `Meta.limited_fields` are exposed.
+
+        They are for collections of users, e.g. lists, querysets or pages,
+        and for users other than the one making the request.
+        """
         instance = self.instance
-        if (
-                instance and
-                request is not None and
-                hasattr(request, 'user') and
-                request.user != instance
-        ) or type(instance) == list:
-            result = fields.copy()
-            for field in fields:
-                if field not in limited_fields:
-                    result.pop(field)
-            return result
-        return fields
+        if instance is None:
+            return False
+        if not isinstance(instance, Model) and hasattr(instance, '__iter__'):
+            return True
+        request = self.context.get('request', None)
+        return request is not None and \
+            hasattr(request, 'user') and \
+            request.user != instance
+
+    def get_field_names(self, declared_fields, info):
+        names = super(UserSerializer, self).get_field_names(
+            declared_fields,
+            info,
+        )
+        if not self.is_limited():
+            return names
+        limited_fields = set(getattr(self.Meta, 'limited_fields', names))
+        return [name for name in names if name in limited_fields]
+
+    def get_fields(self):
+        # the limited and full fields are built once per serializer class,
+        # instances get copies of them
+        cls = type(self)
+        if '_fields' not in cls.__dict__:
+            cls._fields = {}
+        limited = self.is_limited()
+        if limited not in cls._fields:
+            cls._fields[limited] = super(UserSerializer, self).get_fields()
+        return copy.deepcopy(cls._fields[limited])
 
     class Meta:
         model = User
@@ -0,0 +1,71 @@
+"""Signal handlers keeping jasonpi caches in sync with the database."""
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from jasonpi.bloom import get_email_filter, reset_email_filter
+from jasonpi.cache import \
+    get_user_cache, \
+    reset_profile_cache, \
+    reset_token_cache, \
+    reset_user_cache
+from jasonpi.discovery import reset_service
+from jasonpi.hashing import reset_pool
+from jasonpi.keys import reset_keyring
+from jasonpi.last_login import reset_tracker
+from jasonpi.models import Provider
+from jasonpi.providers import reset_providers
+from jasonpi.revocation import reset_revocation_list
+from jasonpi.s3 import reset_client
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def invalidate_user(sender, instance, **kwargs):
+    cache = get_user_cache()
+    if cache is not None:
+        cache.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def add_email(sender, instance, **kwargs):
+    email_filter = get_email_filter()
+    if email_filter is not None:
+        email_filter.add(instance.email)
+
+
+@receiver(post_save, sender=Provider)
+@receiver(post_delete, sender=Provider)
+def invalidate_provider_user(sender, instance, **kwargs):
+    cache = get_user_cache()
+    if cache is not None:
+        cache.invalidate(instance.user_id)
+
+
+@receiver(setting_changed)
+def reload_caches(setting, **kwargs):
+    if setting.startswith('JASONPI_USER_CACHE'):
+        reset_user_cache()
+    elif setting.startswith('JASONPI_TOKEN_CACHE'):
+        reset_token_cache()
+    elif setting.startswith('JASONPI_TOKEN_REVOCATION'):
+        reset_revocation_list()
+    elif setting in ('JASONPI_JWT_KEYS', 'SECRET_KEY'):
+        reset_keyring()
+        reset_token_cache()
+    elif setting.startswith('JASONPI_PROVIDER_CACHE'):
+        reset_profile_cache()
+    elif setting == 'JASONPI_PROVIDERS':
+        reset_providers()
+    elif setting.startswith('JASONPI_GOOGLE_DISCOVERY'):
+        reset_service()
+    elif setting.startswith('JASONPI_LAST_LOGIN'):
+        reset_tracker()
+    elif setting.startswith('JASONPI_HASHER'):
+        reset_pool()
+    elif setting.startswith('JASONPI_EMAIL_FILTER'):
+        reset_email_filter()
+    elif setting.startswith('JASONPI_S3_CLIENT'):
+        reset_client()
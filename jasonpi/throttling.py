@@ -0,0 +1,128 @@
+"""Token bucket throttles for the authentication views.
+
+Buckets live in the django cache `JASONPI_THROTTLE_CACHE`, shared by every
+worker using that cache. Rates are set per scope in
+`JASONPI_THROTTLE_RATES`, e.g. `{'signin_ip': '20/min'}`: the bucket holds
+20 tokens and gains one every 3 seconds. Scopes without a rate aren't
+throttled.
+
+Each bucket is a single number, its theoretical arrival time as in GCRA:
+taking a token pushes it 3 seconds later, and the bucket is empty when it
+is more than a minute ahead. It is read and written under a lock key taken
+with `cache.add`, which is atomic, so concurrent workers never take the
+same token, and a check costs an add, a get, a set and a delete whatever
+the rate.
+"""
+
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """Return the capacity and period in seconds of a rate like 5/min."""
+    capacity, period = rate.split('/')
+    return int(capacity), PERIODS[period[0]]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Allow `capacity` requests per `period` and key, refilled smoothly.
+
+    The scope is suffixed to the `throttle_scope` of the view, so that a
+    throttle class serves several views with their own rates.
+    """
+
+    scope_suffix = None
+    key_prefix = 'jasonpi:throttle:'
+    # the lock of a bucket is awaited for up to 20 * 10 ms
+    lock_attempts = 20
+    lock_delay = 0.01
+    lock_timeout = 1
+
+    def __init__(self):
+        self.wait_time = None
+
+    def get_scope(self, view):
+        return '%s_%s' % (getattr(view, 'throttle_scope', None),
+                          self.scope_suffix)
+
+    def get_cache_key(self, request, view):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        scope = self.get_scope(view)
+        rate = getattr(settings, 'JASONPI_THROTTLE_RATES', {}).get(scope)
+        if rate is None:
+            return True
+        key = self.get_cache_key(request, view)
+        if key is None:
+            return True
+        capacity, period = parse_rate(rate)
+        return self.consume(
+            '%s%s:%s' % (self.key_prefix, scope, key),
+            capacity,
+            period,
+        )
+
+    def consume(self, key, capacity, period):
+        """Take a token from the bucket at key, False if it is empty."""
+        cache = caches[getattr(settings, 'JASONPI_THROTTLE_CACHE', 'default')]
+        lock = key + ':lock'
+        for _ in range(self.lock_attempts):
+            if cache.add(lock, True, timeout=self.lock_timeout):
+                break
+            time.sleep(self.lock_delay)
+        else:
+            # too many concurrent requests for key
+            self.wait_time = self.lock_delay
+            return False
+        try:
+            interval = period / capacity
+            now = time.time()
+            arrival = max(now, cache.get(key, now))
+            # the bucket is empty when the next token is over a period away
+            wait = arrival + interval - now - period
+            if wait > 0:
+                self.wait_time = wait
+                return False
+            cache.set(key, arrival + interval, timeout=int(math.ceil(period)))
+            self.wait_time = None
+            return True
+        finally:
+            cache.delete(lock)
+
+    def wait(self):
+        return self.wait_time
+
+
+class IPThrottle(TokenBucketThrottle):
+    """Throttle requests by client ip."""
+
+    scope_suffix = 'ip'
+
+    def get_cache_key(self, request, view):
+        return self.get_ident(request)
+
+
+class AccountThrottle(TokenBucketThrottle):
+    """Throttle requests by targeted account, its email or social uid."""
+
+    scope_suffix = 'account'
+
+    def get_cache_key(self, request, view):
+        data = request.data
+        if not hasattr(data, 'get'):
+            return None
+        email = data.get('email')
+        if isinstance(email, str):
+            return email.lower()
+        uid = data.get('uid')
+        if isinstance(uid, str):
+            return '%s:%s' % (data.get('provider'), uid)
+        return None
@@ -4,9 +4,20 @@ from jasonpi import views
 
 urlpatterns = [
     url(r'^auth/s3$', views.s3_get_presigned_url),
+    url(r'^auth/s3/batch$', views.s3_get_presigned_urls),
+    url(r'^auth/s3/post$', views.s3_get_presigned_post),
+    url(r'^auth/s3/multipart$', views.s3_create_multipart_upload),
+    url(r'^auth/s3/multipart/parts$', views.s3_presign_multipart_parts),
+    url(
+        r'^auth/s3/multipart/complete$',
+        views.s3_complete_multipart_upload,
+    ),
+    url(r'^auth/s3/multipart/abort$', views.s3_abort_multipart_upload),
     url(r'^auth/s3/signature$', views.s3_sign_policy_document),
     url(r'^auth/signin$', views.AuthSignInView.as_view()),
+    url(r'^auth/refresh$', views.AuthRefreshView.as_view()),
     url(r'^auth/signout$', views.signout),
+    url(r'^auth/jwks$', views.jwks),
     url(
         r'^auth/register$',
         views.AuthRegisterView.as_view({'post': 'create'}),
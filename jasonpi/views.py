@@ -1,14 +1,7 @@
 from datetime import datetime, date, timezone
-import os
-import hashlib
-import base64
-import hmac
 import json
 import uuid
-import boto3
-import re
 
-from django.http import HttpResponseBadRequest
 from django.conf import settings
 from django.utils.translation import ugettext_lazy as _
 from django.utils.module_loading import import_string
@@ -27,11 +20,19 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny
 from rest_framework_json_api import renderers, parsers as jsonapi_parsers
+from rest_framework_json_api.utils import get_included_resources
+
+from botocore.exceptions import ClientError
 
 from jasonpi.serializers import \
     UserSerializer as JPIUserSerializer, \
     ProviderSerializer
-from jasonpi.auth import get_token
+from jasonpi import hashing, refresh, s3
+from jasonpi.auth import get_request_token, get_token, revoke_token
+from jasonpi.bloom import get_email_filter
+from jasonpi.keys import get_keyring
+from jasonpi.last_login import update_last_login
+from jasonpi.throttling import AccountThrottle, IPThrottle
 
 User = get_user_model()
 
@@ -52,10 +53,75 @@ else:
         )
 
 
+def set_refresh_token(response, user, serializer=None):
+    """Issue a refresh token in a cookie when refresh tokens are enabled."""
+    if not refresh.is_enabled():
+        return
+    token = refresh.issue_refresh_token(user)
+    set_refresh_cookie(response, token)
+    if serializer is not None:
+        serializer.refresh_token = token
+
+
+def set_refresh_cookie(response, token):
+    response.set_cookie(
+        'refresh_token',
+        token,
+        secure=not settings.DEBUG,
+        httponly=True
+    )
+
+
+class PrefetchForIncludesMixin(object):
+    """Apply the query plans declared by the serializer of a view.
+
+    Serializers map the paths of their fields and include paths to the
+    relations to select or prefetch in `select_for_includes` and
+    `prefetch_for_includes`, `__all__` applying to every request, e.g.::
+
+        prefetch_for_includes = {
+            'providers': ['providers'],
+            'providers.user': ['providers__user'],
+        }
+
+    A plan is applied when its field is rendered, as relationship data
+    or as an included resource, so that serializing a page of objects
+    costs a constant number of queries.
+    """
+
+    def get_rendered_paths(self, serializer_class):
+        lookup = self.lookup_url_kwarg or self.lookup_field
+        many = self.kwargs.get(lookup) is None
+        serializer = self.get_serializer([] if many else None, many=many)
+        fields = serializer.child.fields if many else serializer.fields
+        paths = {'__all__'}
+        paths.update(fields)
+        for path in get_included_resources(self.request, serializer_class):
+            parts = path.split('.')
+            paths.update(
+                '.'.join(parts[:index + 1]) for index in range(len(parts))
+            )
+        return paths
+
+    def get_queryset(self):
+        queryset = super(PrefetchForIncludesMixin, self).get_queryset()
+        serializer_class = self.get_serializer_class()
+        select = getattr(serializer_class, 'select_for_includes', {})
+        prefetch = getattr(serializer_class, 'prefetch_for_includes', {})
+        for path in self.get_rendered_paths(serializer_class):
+            if path in select:
+                queryset = queryset.select_related(*select[path])
+            if path in prefetch:
+                queryset = queryset.prefetch_related(*prefetch[path])
+        return queryset
+
+
 class AuthSignInView(APIView):
     parser_classes = (parsers.JSONParser, )
     permission_classes = (AllowAny, )
     renderer_classes = (renderers.JSONRenderer, )
+    throttle_classes = (IPThrottle, AccountThrottle)
+    throttle_scope = 'signin'
     resource_name = 'users'
 
     def post(self, request):
@@ -65,15 +131,19 @@ class AuthSignInView(APIView):
             password = request.data.get('password')
         except AttributeError:
             raise exceptions.ValidationError(msg)
+        email_filter = get_email_filter()
+        if email_filter is not None and not email_filter.might_exist(email):
+            hashing.dummy_check_password(password)
+            raise exceptions.ValidationError(msg)
         try:
-            user = User.objects.get(email=email)
+            user = User.objects.get_by_email(email)
         except User.DoesNotExist:
+            hashing.dummy_check_password(password)
             raise exceptions.ValidationError(msg)
-        if not user.check_password(password):
+        if not hashing.check_password(user, password):
             raise exceptions.ValidationError(msg)
         token = get_token(user)
-        user.last_login = datetime.now(timezone.utc)
-        user.save()
+        update_last_login(user)
         user_serializer = UserSerializer(user, context={'request': request})
         response = Response(user_serializer.data)
         response.set_cookie(
@@ -83,14 +153,61 @@ class AuthSignInView(APIView):
             httponly=True
         )
         user_serializer.token = token
+        set_refresh_token(response, user, user_serializer)
+        return response
+
+
+class AuthRefreshView(APIView):
+    parser_classes = (parsers.JSONParser, )
+    permission_classes = (AllowAny, )
+    renderer_classes = (default_renderers.JSONRenderer, )
+    authentication_classes = ()
+
+    def get_authenticate_header(self, request):
+        # refused refresh tokens are 401s, not 403s
+        return 'Bearer'
+
+    def post(self, request):
+        token = request.COOKIES.get('refresh_token')
+        if hasattr(request.data, 'get'):
+            token = request.data.get('refresh_token', token)
+        user, refresh_token = refresh.rotate_refresh_token(token)
+        token = get_token(user)
+        response = Response({
+            'access_token': token,
+            'refresh_token': refresh_token,
+        })
+        response.set_cookie(
+            'access_token',
+            token,
+            secure=not settings.DEBUG,
+            httponly=True
+        )
+        set_refresh_cookie(response, refresh_token)
         return response
 
 
 @api_view()
 @permission_classes([AllowAny])
 def signout(request):
+    token = get_request_token(request)
+    if token is not None:
+        revoke_token(token)
+    if 'refresh_token' in request.COOKIES:
+        refresh.revoke_refresh_token(request.COOKIES['refresh_token'])
     response = Response(status=204)
     response.delete_cookie('access_token')
+    response.delete_cookie('refresh_token')
+    return response
+
+
+@api_view()
+@permission_classes([AllowAny])
+@renderer_classes([default_renderers.JSONRenderer])
+def jwks(request):
+    """Publish the public keys verifying our tokens."""
+    response = Response(get_keyring().jwks())
+    response['Cache-Control'] = 'public, max-age=3600'
     return response
 
 
@@ -98,6 +215,8 @@ class AuthProviderView(APIView):
     parser_classes = (parsers.JSONParser, )
     permission_classes = (AllowAny, )
     renderer_classes = (renderers.JSONRenderer, )
+    throttle_classes = (IPThrottle, AccountThrottle)
+    throttle_scope = 'provider'
     resource_name = 'users'
 
     def post(self, request):
@@ -107,12 +226,10 @@ class AuthProviderView(APIView):
                 context={'request': request}
             )
             provider_serializer.is_valid(raise_exception=True)
-            provider_serializer.save()
+            provider_serializer.save(last_login=datetime.now(timezone.utc))
             user = provider_serializer.instance
             token = get_token(user)
             print('AuthProviderView token =', token)
-            user.last_login = datetime.now(timezone.utc)
-            user.save()
             user_serializer = UserSerializer(
                 user,
                 context={'request': request},
@@ -125,6 +242,7 @@ class AuthProviderView(APIView):
                 httponly=True
             )
             user_serializer.token = token
+            set_refresh_token(response, user, user_serializer)
             return response
         except Exception as e:
             raise e
@@ -135,6 +253,8 @@ class AuthRegisterView(mixins.CreateModelMixin,
     parser_classes = (jsonapi_parsers.JSONParser, )
     serializer_class = UserSerializer
     permission_classes = (AllowAny, )
+    throttle_classes = (IPThrottle, AccountThrottle)
+    throttle_scope = 'register'
     resource_name = 'users'
 
     def create(self, request, *args, **kwargs):
@@ -151,77 +271,253 @@ class AuthRegisterView(mixins.CreateModelMixin,
             httponly=True
         )
         response.data.serializer.token = token
+        set_refresh_token(
+            response,
+            response.data.serializer.instance,
+            response.data.serializer,
+        )
         return response
 
 
 @api_view()
 @renderer_classes([default_renderers.JSONRenderer])
 def s3_get_presigned_url(request):
-    s3 = boto3.client('s3')
     object_name = request.GET.get('objectName')
+    if not object_name:
+        raise exceptions.ValidationError({'error': _('Missing objectName')})
+    key, url = presign_put(
+        s3.get_client(),
+        request,
+        object_name,
+        request.GET.get('contentType', None),
+    )
+    return Response({'signedUrl': url})
+
+
+@api_view(['POST'])
+@renderer_classes([default_renderers.JSONRenderer])
+def s3_get_presigned_urls(request):
+    """Presign the upload of a list of files in one request.
+
+    The body is `{"files": [{"objectName": ..., "contentType": ...}]}`,
+    the response lists the key and signed url of each file in order.
+    """
+    files = None
+    if hasattr(request.data, 'get'):
+        files = request.data.get('files')
+    if not isinstance(files, list) or not files:
+        raise exceptions.ValidationError({'error': _('Missing files')})
+    for f in files:
+        if not isinstance(f, dict) or not f.get('objectName'):
+            raise exceptions.ValidationError(
+                {'error': _('Missing objectName')})
+    limit = getattr(settings, 'JASONPI_S3_BATCH_LIMIT', 100)
+    if len(files) > limit:
+        raise exceptions.ValidationError(
+            {'error': _('At most %d files per request') % limit})
+    client = s3.get_client()
+    signed_urls = []
+    for f in files:
+        key, url = presign_put(
+            client,
+            request,
+            f['objectName'],
+            f.get('contentType', None),
+        )
+        signed_urls.append({
+            'objectName': f['objectName'],
+            'key': key,
+            'signedUrl': url,
+        })
+    return Response({'signedUrls': signed_urls})
+
+
+@api_view()
+@renderer_classes([default_renderers.JSONRenderer])
+def s3_get_presigned_post(request):
+    """Presign a form upload whose size and content type are enforced by
+    S3 within the limits of the key's category."""
+    object_name = request.GET.get('objectName')
+    if not object_name:
+        raise exceptions.ValidationError({'error': _('Missing objectName')})
+    key = s3_key_getter(request, object_name.split('.')[-1])
+    match = s3.validate_key(key, request.user.id)
+    fields, conditions = s3.post_conditions(
+        s3.upload_limits(match.group('category')),
+        request.GET.get('contentType', None),
+    )
+    post = s3.get_client().generate_presigned_post(
+        settings.BUCKET,
+        key,
+        Fields=fields,
+        Conditions=conditions,
+        ExpiresIn=3600,
+    )
+    return Response({'key': key, 'url': post['url'], 'fields': post['fields']})
+
+
+def presign_put(client, request, object_name, content_type=None):
+    """Return the key and presigned put url of an upload by request.user."""
     ext = object_name.split('.')[-1]
     key = s3_key_getter(request, ext)
-    bucket = settings.BUCKET
-    user_id = request.user.id
-    regex = re.compile(
-        r'u?%d/(assets|misc)/[0-9]{4}-[0-9]{2}-[0-9]{2}_[0-9a-z-]+\.[^\.]+' %
-        user_id,
-    )
-    if not regex.match(key):
-        raise HttpResponseBadRequest({'error': 'Wrong S3 Key'})
+    s3.validate_key(key, request.user.id)
     params = {
-        'Bucket': bucket,
+        'Bucket': settings.BUCKET,
         'Key': key,
         'ACL': 'public-read',
     }
-    content_type = request.GET.get('contentType', None)
     if content_type is not None:
         params['ContentType'] = content_type
-    url = s3.generate_presigned_url(
+    url = client.generate_presigned_url(
         'put_object',
         Params=params,
         ExpiresIn=3600
     )
-    return Response({'signedUrl': url})
+    return key, url
+
+
+def get_multipart_upload(request):
+    """Return the key and upload id of the multipart upload of request,
+    checking that the key belongs to request.user."""
+    data = request.data if hasattr(request.data, 'get') else {}
+    key = data.get('key')
+    upload_id = data.get('uploadId')
+    if not isinstance(key, str) or not isinstance(upload_id, str):
+        raise exceptions.ValidationError(
+            {'error': _('Missing key or uploadId')})
+    s3.validate_key(key, request.user.id)
+    return key, upload_id
+
+
+def call_s3(method, **kwargs):
+    """Call the S3 client, turning client errors into 400s."""
+    try:
+        return getattr(s3.get_client(), method)(**kwargs)
+    except ClientError as e:
+        raise exceptions.ValidationError(
+            {'error': e.response.get('Error', {}).get('Message', str(e))})
+
+
+@api_view(['POST'])
+@renderer_classes([default_renderers.JSONRenderer])
+def s3_create_multipart_upload(request):
+    """Start a multipart upload of `objectName` by request.user."""
+    data = request.data if hasattr(request.data, 'get') else {}
+    object_name = data.get('objectName')
+    if not isinstance(object_name, str) or not object_name:
+        raise exceptions.ValidationError({'error': _('Missing objectName')})
+    key = s3_key_getter(request, object_name.split('.')[-1])
+    s3.validate_key(key, request.user.id)
+    params = {
+        'Bucket': settings.BUCKET,
+        'Key': key,
+        'ACL': 'public-read',
+    }
+    if data.get('contentType') is not None:
+        params['ContentType'] = data['contentType']
+    upload = call_s3('create_multipart_upload', **params)
+    return Response({'key': key, 'uploadId': upload['UploadId']})
+
+
+@api_view(['POST'])
+@renderer_classes([default_renderers.JSONRenderer])
+def s3_presign_multipart_parts(request):
+    """Presign the upload of parts `firstPart` to `lastPart` included."""
+    key, upload_id = get_multipart_upload(request)
+    try:
+        first = int(request.data.get('firstPart', 1))
+        last = int(request.data.get('lastPart', first))
+    except (TypeError, ValueError):
+        raise exceptions.ValidationError(
+            {'error': _('firstPart and lastPart must be integers')})
+    limit = getattr(settings, 'JASONPI_S3_MULTIPART_PARTS_LIMIT', 100)
+    # S3 numbers parts from 1 to 10000
+    if not 1 <= first <= last <= 10000 or last - first >= limit:
+        raise exceptions.ValidationError(
+            {'error': _('At most %d parts between 1 and 10000') % limit})
+    client = s3.get_client()
+    parts = [
+        {
+            'partNumber': number,
+            'signedUrl': client.generate_presigned_url(
+                'upload_part',
+                Params={
+                    'Bucket': settings.BUCKET,
+                    'Key': key,
+                    'UploadId': upload_id,
+                    'PartNumber': number,
+                },
+                ExpiresIn=3600,
+            ),
+        }
+        for number in range(first, last + 1)
+    ]
+    return Response({'parts': parts})
+
+
+@api_view(['POST'])
+@renderer_classes([default_renderers.JSONRenderer])
+def s3_complete_multipart_upload(request):
+    """Assemble the uploaded `parts`, a list of partNumber and etag."""
+    key, upload_id = get_multipart_upload(request)
+    parts = request.data.get('parts')
+    try:
+        parts = [
+            {'PartNumber': int(part['partNumber']), 'ETag': part['etag']}
+            for part in parts
+        ]
+    except (KeyError, TypeError, ValueError):
+        raise exceptions.ValidationError(
+            {'error': _('parts must be a list of partNumber and etag')})
+    result = call_s3(
+        'complete_multipart_upload',
+        Bucket=settings.BUCKET,
+        Key=key,
+        UploadId=upload_id,
+        MultipartUpload={'Parts': parts},
+    )
+    return Response({'key': key, 'location': result.get('Location')})
+
+
+@api_view(['POST'])
+@renderer_classes([default_renderers.JSONRenderer])
+def s3_abort_multipart_upload(request):
+    """Abort a multipart upload, freeing its uploaded parts."""
+    key, upload_id = get_multipart_upload(request)
+    call_s3(
+        'abort_multipart_upload',
+        Bucket=settings.BUCKET,
+        Key=key,
+        UploadId=upload_id,
+    )
+    return Response(status=204)
 
 
 @api_view(['POST'])
 @renderer_classes([default_renderers.JSONRenderer])
 def s3_sign_policy_document(request):
-    request_payload = json.loads(request.body)
-    headers = request_payload.get('headers', None)
-    if headers:
-        # The presence of the 'headers' property in the request payload
-        # means this is a request to sign a REST/multipart request
-        # and NOT a policy document
-        response_data = sign_headers(headers)
-    else:
-        response_data = sign_policy_document(request_payload)
+    try:
+        request_payload = json.loads(request.body)
+        headers = request_payload.get('headers', None)
+        if headers:
+            # The presence of the 'headers' property in the request payload
+            # means this is a request to sign a REST/multipart request
+            # and NOT a policy document
+            response_data = sign_headers(headers)
+        else:
+            response_data = sign_policy_document(request_payload)
+    except ValueError as e:
+        raise exceptions.ValidationError({'error': str(e)})
     return Response(response_data)
 
 
 def sign_headers(headers):
     """ Sign and return the headers for a chunked upload. """
-    return {
-        'signature': base64.b64encode(hmac.new(
-            os.environ.get('AWS_SECRET_ACCESS_KEY').encode('utf-8'),
-            headers.encode('utf-8'),
-            hashlib.sha1,
-        ).digest()).decode('utf-8'),
-    }
+    return s3.get_signer().sign_headers(headers)
 
 
 def sign_policy_document(policy_document):
     """ Sign and return the policy doucument for a simple upload.
     http://aws.amazon.com/articles/1434/#signyours3postform
     """
-    policy = base64.b64encode(json.dumps(policy_document).encode('utf-8'))
-    signature = base64.b64encode(hmac.new(
-        os.environ.get('AWS_SECRET_ACCESS_KEY').encode('utf-8'),
-        policy,
-        hashlib.sha1,
-    ).digest())
-    return {
-        'policy': policy.decode('utf-8'),
-        'signature': signature.decode('utf-8'),
-    }
+    return s3.get_signer().sign_policy_document(policy_document)
@@ -19,11 +19,13 @@ setup(
         'django',
         'boto3',
         'pyjwt',
+        'cryptography',
         'httplib2',
         'oauth2client',
         'google-api-python-client',
         'facebook-sdk',
         'inflect',
+        'urllib3',
     ],
     setup_requires=['pytest-runner'],
     tests_require=['pytest'],
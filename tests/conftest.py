@@ -0,0 +1,23 @@
+import os
+
+import django
+import pytest
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'testapp.settings')
+django.setup()
+
+
+@pytest.fixture(scope='session')
+def django_db_setup():
+    """Create the tables of the in-memory test database once."""
+    from django.core.management import call_command
+    call_command('migrate', run_syncdb=True, verbosity=0)
+
+
+@pytest.fixture
+def db(django_db_setup):
+    """Run a test inside a transaction that is rolled back afterwards."""
+    from django.db import transaction
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
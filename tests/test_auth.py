@@ -0,0 +1,161 @@
+import time
+
+import pytest
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+
+import jwt
+
+from jasonpi.auth import \
+    JWTAuthentication, \
+    decode_token, \
+    get_token
+from jasonpi.cache import reset_token_cache
+from jasonpi.models import Provider
+
+User = get_user_model()
+factory = APIRequestFactory()
+
+
+def authenticate(token):
+    request = factory.get('/', HTTP_AUTHORIZATION='Bearer %s' % token)
+    return JWTAuthentication().authenticate(request)
+
+
+def test_authenticate_loads_user(db):
+    """Test that a regular token resolves the user from the database."""
+    user = User.objects.create_user('some@email.com', 'password')
+    token = get_token(user)
+    with CaptureQueriesContext(connection) as queries:
+        authenticated, _ = authenticate(token)
+    assert len(queries) == 1
+    assert authenticated == user
+    assert isinstance(authenticated, User)
+
+
+@override_settings(JASONPI_STATELESS_TOKEN=True)
+def test_stateless_token_skips_query(db):
+    """Test that a stateless token authenticates without any query."""
+    user = User.objects.create_user('some@email.com', 'password')
+    token = get_token(user)
+    with CaptureQueriesContext(connection) as queries:
+        authenticated, _ = authenticate(token)
+        assert isinstance(authenticated, User)
+        assert 'first_name' in authenticated.get_deferred_fields()
+        assert authenticated.pk == user.pk
+        assert authenticated.email == user.email
+        assert authenticated.is_staff is False
+        assert authenticated.is_authenticated
+        assert authenticated == user
+        assert user == authenticated
+    assert len(queries) == 0
+
+
+@override_settings(JASONPI_STATELESS_TOKEN=True)
+def test_stateless_token_lazy_fields(db):
+    """Test that fields missing from the token are loaded only once."""
+    user = User.objects.create_user(
+        'some@email.com', 'password', first_name='Alfred')
+    authenticated, _ = authenticate(get_token(user))
+    with CaptureQueriesContext(connection) as queries:
+        assert authenticated.first_name == 'Alfred'
+        assert authenticated.date_joined == user.date_joined
+    assert len(queries) == 1
+    assert not authenticated.get_deferred_fields()
+
+
+@override_settings(JASONPI_STATELESS_TOKEN=True)
+def test_stateless_token_user_in_queries(db):
+    """Test that the token user works as a model instance in the ORM."""
+    user = User.objects.create_user('some@email.com', 'password')
+    authenticated, _ = authenticate(get_token(user))
+    provider = Provider(user=authenticated, provider='google', uid='1')
+    provider.save()
+    assert list(Provider.objects.filter(user=authenticated)) == [provider]
+    authenticated.first_name = 'Alfred'
+    authenticated.save()
+    user.refresh_from_db()
+    assert user.first_name == 'Alfred'
+
+
+@override_settings(JASONPI_STATELESS_TOKEN=True)
+def test_stateless_token_user_keeps_current_claims(db):
+    """Test that saving a token user doesn't write back older claims."""
+    user = User.objects.create_user(
+        'staff@email.com', 'password', is_staff=True)
+    token = get_token(user)
+    user.is_staff = False
+    user.email = 'demoted@email.com'
+    user.save()
+    authenticated, _ = authenticate(token)
+    authenticated.first_name = 'Alfred'
+    authenticated.save()
+    user.refresh_from_db()
+    assert user.first_name == 'Alfred'
+    assert user.is_staff is False
+    assert user.email == 'demoted@email.com'
+    assert user.email_canonical == 'demoted@email.com'
+    authenticated.email = 'changed@email.com'
+    authenticated.save()
+    user.refresh_from_db()
+    assert user.email == 'changed@email.com'
+    assert user.is_staff is False
+
+
+def test_stateless_token_versions(db):
+    """Test that claims are only trusted for the current version."""
+    user = User.objects.create_user('some@email.com', 'password')
+    with override_settings(JASONPI_STATELESS_TOKEN=True):
+        token = get_token(user)
+    payload = jwt.decode(token, options={'verify_signature': False})
+    assert payload['ver'] == 1
+    assert payload['email'] == user.email
+    assert isinstance(authenticate(token)[0], User)
+    with override_settings(JASONPI_STATELESS_TOKEN=True):
+        stale = jwt.encode(
+            dict(payload, ver=0), settings.SECRET_KEY, algorithm='HS256')
+        assert isinstance(authenticate(stale)[0], User)
+
+
+def test_decode_token_cache(db, mocker):
+    """Test that a verified token is not verified again."""
+    user = User.objects.create_user('some@email.com', 'password')
+    token = get_token(user)
+    reset_token_cache()
+    decode = mocker.spy(jwt, 'decode')
+    assert decode_token(token)['user_id'] == user.pk
+    assert decode_token(token)['user_id'] == user.pk
+    assert decode.call_count == 1
+
+
+def test_decode_token_cache_rejects_tampered_tokens(db):
+    """Test that a token differing from a cached one is verified."""
+    user = User.objects.create_user('some@email.com', 'password')
+    token = get_token(user)
+    decode_token(token)
+    header, payload, signature = token.split('.')
+    forged = jwt.encode(
+        {'user_id': user.pk + 1, 'exp': time.time() + 60},
+        'another-secret-key-long-enough-for-hs256',
+        algorithm='HS256',
+    )
+    with pytest.raises(jwt.InvalidSignatureError):
+        decode_token('.'.join([header, forged.split('.')[1], signature]))
+
+
+def test_decode_token_cache_expires_with_token(db):
+    """Test that cached claims are dropped when the token expires."""
+    token = jwt.encode(
+        {'user_id': 1, 'exp': time.time() + 1},
+        settings.SECRET_KEY,
+        algorithm='HS256',
+    )
+    decode_token(token)
+    time.sleep(1.1)
+    with pytest.raises(jwt.ExpiredSignatureError):
+        decode_token(token)
@@ -0,0 +1,124 @@
+import time
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+
+from jasonpi import hashing
+from jasonpi.bloom import BloomFilter, EmailFilter, get_email_filter
+from jasonpi.views import AuthSignInView
+
+User = get_user_model()
+
+
+def test_bloom_filter_has_no_false_negatives():
+    """Test that every added item is found and few others are."""
+    bloom = BloomFilter(1000, 0.01)
+    for i in range(1000):
+        bloom.add('user%d@email.com' % i)
+    assert all('user%d@email.com' % i in bloom for i in range(1000))
+    false_positives = sum(
+        'other%d@email.com' % i in bloom for i in range(10000)
+    )
+    assert false_positives < 300
+    copy = BloomFilter.from_bytes(bloom.to_bytes())
+    assert 'user1@email.com' in copy and copy.hashes == bloom.hashes
+
+
+def test_email_filter_follows_users(db):
+    """Test that users created here and elsewhere are found."""
+    User.objects.create_user('First@email.com')
+    email_filter = EmailFilter(1000, 0.001, sync_interval=0)
+    assert email_filter.might_exist('first@email.com')
+    assert not email_filter.might_exist('second@email.com')
+    assert not email_filter.might_exist(None)
+    User.objects.bulk_create([User(email='second@email.com')])
+    assert email_filter.might_exist('second@email.com')
+
+
+def test_email_filter_follows_email_changes(db):
+    """Test that emails changed by another process are found."""
+    user = User.objects.create_user('first@email.com')
+    email_filter = EmailFilter(1000, 0.001, sync_interval=0)
+    assert not email_filter.might_exist('changed@email.com')
+    # saved elsewhere, the post_save signal doesn't reach this filter
+    User.objects.filter(pk=user.pk).update(
+        email='changed@email.com', updated_at=timezone.now())
+    assert email_filter.might_exist('changed@email.com')
+
+
+def test_email_filter_serves_while_syncing(db):
+    """Test that a sync in another thread doesn't block lookups."""
+    User.objects.create_user('first@email.com')
+    email_filter = EmailFilter(1000, 0.001, sync_interval=0)
+    email_filter.syncing = True
+    with CaptureQueriesContext(connection) as queries:
+        # no filter yet, the lookup decides
+        assert email_filter.might_exist('unknown@email.com')
+        email_filter.syncing = False
+        assert not email_filter.might_exist('unknown@email.com')
+        email_filter.syncing = True
+        User.objects.create_user('second@email.com')
+        count = len(queries)
+        assert not email_filter.might_exist('other@email.com')
+        assert len(queries) == count
+
+
+def test_email_filter_ignores_stale_shared_copy(db):
+    """Test that a shared filter older than the rebuild interval is
+    replaced."""
+    user = User.objects.create_user('first@email.com')
+    bloom, _ = EmailFilter(1000, 0.001, cache='default').store()
+    user.email = 'changed@email.com'
+    user.save()
+    cache = caches['default']
+    cache.clear()
+    cache.set(EmailFilter.cache_key, (time.time() - 7200, bloom.to_bytes()))
+    other = EmailFilter(1000, 0.001, sync_interval=3600, cache='default')
+    assert other.might_exist('changed@email.com')
+    built, _ = cache.get(EmailFilter.cache_key)
+    assert time.time() - built < 60
+
+
+@override_settings(
+    JASONPI_EMAIL_FILTER=True,
+    JASONPI_EMAIL_FILTER_CACHE='default',
+    JASONPI_EMAIL_FILTER_SYNC_INTERVAL=3600,
+)
+def test_email_filter_is_shared(db):
+    """Test that the command shares the filter and saves are published."""
+    User.objects.create_user('first@email.com')
+    out = StringIO()
+    call_command('jasonpi_rebuild_email_filter', stdout=out)
+    assert 'Stored' in out.getvalue()
+    other = EmailFilter(1000, 0.001, sync_interval=3600, cache='default')
+    with CaptureQueriesContext(connection) as queries:
+        assert other.might_exist('first@email.com')
+    assert len(queries) == 0
+    User.objects.create_user('second@email.com')
+    assert other.might_exist('second@email.com')
+    assert get_email_filter().might_exist('second@email.com')
+
+
+@override_settings(JASONPI_EMAIL_FILTER=True)
+def test_sign_in_unknown_email_skips_database(db, mocker):
+    """Test that an unknown email costs a dummy hash and no query."""
+    User.objects.create_user('some@email.com', 'password')
+    get_email_filter().might_exist('some@email.com')
+    dummy = mocker.spy(hashing, 'dummy_check_password')
+    request = APIRequestFactory().post(
+        '/auth/signin',
+        {'email': 'unknown@email.com', 'password': 'password'},
+        format='json',
+    )
+    with CaptureQueriesContext(connection) as queries:
+        response = AuthSignInView.as_view()(request)
+    assert response.status_code == 400
+    assert len(queries) == 0
+    dummy.assert_called_once_with('password')
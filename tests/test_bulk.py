@@ -0,0 +1,131 @@
+import io
+import json
+
+import pytest
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from jasonpi import bulk
+from jasonpi.models import Provider
+
+User = get_user_model()
+
+
+def jsonl(*records):
+    return io.StringIO(''.join(json.dumps(r) + '\n' for r in records))
+
+
+def test_import_users(db):
+    """Test that users are imported in batches with their providers."""
+    User.objects.create_user('taken@email.com', 'password')
+    records = [
+        {
+            'email': 'user%d@EMAIL.com' % i,
+            'password': make_password('secret'),
+            'first_name': 'User %d' % i,
+            'providers': [{'provider': 'google', 'uid': str(i)}],
+        }
+        for i in range(5)
+    ]
+    records += [{'email': 'taken@email.com'}, {'email': 'user0@email.com'}]
+    with CaptureQueriesContext(connection) as queries:
+        stats = bulk.import_users(
+            bulk.read_records(jsonl(*records)),
+            batch_size=4,
+        )
+    # two batches: select, insert users, insert and count providers
+    assert len(queries) <= 2 * 7
+    assert stats['rows'] == 7
+    assert stats['users'] == 5
+    assert stats['providers'] == 5
+    user = User.objects.get(email='user3@email.com')
+    assert user.first_name == 'User 3'
+    assert user.check_password('secret')
+    assert user.providers.get().uid == '3'
+
+
+def test_import_counts_inserted_providers(db):
+    """Test that providers skipped on conflict aren't counted."""
+    user = User.objects.create_user('taken@email.com')
+    Provider.objects.create(user=user, provider='google', uid='1')
+    stats = bulk.import_users([{
+        'email': 'new@email.com',
+        'providers': [
+            {'provider': 'google', 'uid': '1'},
+            {'provider': 'google', 'uid': '2'},
+        ],
+    }])
+    assert stats['users'] == 1
+    assert stats['providers'] == 1
+
+
+def test_import_rejects_invalid_providers(db, tmpdir):
+    """Test that malformed provider links are reported with their line."""
+    with pytest.raises(bulk.RecordError, match='line 1'):
+        bulk.import_users([{'email': 'a@b.c', 'providers': [
+            {'provider': 'google'},
+        ]}])
+    path = tmpdir.join('users.csv')
+    path.write('email,providers\nsome@email.com,google\n')
+    with pytest.raises(CommandError, match='line 1'):
+        call_command('jasonpi_import_users', str(path))
+    assert not User.objects.exists()
+
+
+def test_import_rejects_raw_passwords(db):
+    with pytest.raises(bulk.RecordError):
+        bulk.import_users([{'email': 'a@b.c', 'password': 'secret'}])
+    assert not User.objects.exists()
+
+
+def test_export_import_csv(db, tmpdir):
+    """Test that an exported file imports the same users."""
+    user = User.objects.create_user(
+        'some@email.com', 'password', last_name='Doe')
+    Provider.objects.create(user=user, provider='facebook', uid='42')
+    User.objects.create_user('other@email.com')
+    path = str(tmpdir.join('users.csv'))
+    call_command('jasonpi_export_users', path, stdout=io.StringIO())
+    User.objects.all().delete()
+    call_command('jasonpi_import_users', path, stdout=io.StringIO())
+    user = User.objects.get(email='some@email.com')
+    assert user.last_name == 'Doe'
+    assert user.check_password('password')
+    assert user.providers.get().provider == 'facebook'
+    assert not User.objects.get(email='other@email.com').has_usable_password()
+
+
+def test_import_command_reports_invalid_rows(db, tmpdir):
+    path = tmpdir.join('users.jsonl')
+    path.write('{"first_name": "Nobody"}\n')
+    with pytest.raises(CommandError, match='line 1'):
+        call_command('jasonpi_import_users', str(path))
+
+
+def test_bulk_create_users(db):
+    """Test that users are created with passwords hashed in a pool."""
+    progress = []
+    users = User.objects.bulk_create_users(
+        (
+            {'email': 'user%d@EMAIL.com' % i, 'password': 'secret%d' % i}
+            for i in range(10)
+        ),
+        batch_size=4,
+        workers=2,
+        callback=progress.append,
+    )
+    assert progress == [4, 8, 10]
+    assert len(users) == 10
+    user = User.objects.get(email='user7@email.com')
+    assert user.check_password('secret7')
+    assert not user.is_staff
+
+
+def test_bulk_create_users_requires_email(db):
+    with pytest.raises(ValueError):
+        User.objects.bulk_create_users([{'password': 'secret'}], workers=1)
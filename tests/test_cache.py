@@ -0,0 +1,78 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from jasonpi.cache import LRUCache, get_user_cache
+from jasonpi.models import Provider
+
+User = get_user_model()
+
+
+def test_lru_cache_evicts_least_recently_used():
+    """Test that the oldest entry is evicted and counted."""
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.stats() == {
+        'size': 2,
+        'maxsize': 2,
+        'hits': 3,
+        'misses': 1,
+        'evictions': 1,
+    }
+
+
+def test_lru_cache_expires_entries():
+    """Test that entries are not served after their timeout."""
+    cache = LRUCache(timeout=0.01)
+    cache.set('a', 1)
+    cache.set('b', 2, timeout=60)
+    time.sleep(0.02)
+    assert cache.get('a') is None
+    assert cache.get('b') == 2
+    assert len(cache) == 1
+
+
+@override_settings(JASONPI_USER_CACHE='jasonpi.cache.UserCache')
+def test_user_cache_hits_and_invalidation(db):
+    """Test that users are cached until they or their providers change."""
+    user = User.objects.create_user('some@email.com', 'password')
+    cache = get_user_cache()
+    with CaptureQueriesContext(connection) as queries:
+        assert cache.load(user.pk) == user
+        cached = cache.load(user.pk)
+    assert len(queries) == 1
+    assert cached == user and cached is not cache.load(user.pk)
+
+    user.first_name = 'Alfred'
+    user.save()
+    assert cache.get(user.pk) is None
+    assert cache.load(user.pk).first_name == 'Alfred'
+
+    Provider.objects.create(user=user, uid='1', provider='google')
+    assert cache.get(user.pk) is None
+
+
+@override_settings(
+    JASONPI_USER_CACHE='jasonpi.cache.UserCache',
+    JASONPI_USER_CACHE_BACKEND='default',
+)
+def test_user_cache_shared_backend(db):
+    """Test that the django cache tier refills the local tier."""
+    user = User.objects.create_user('some@email.com', 'password')
+    cache = get_user_cache()
+    cache.load(user.pk)
+    cache.local.clear()
+    with CaptureQueriesContext(connection) as queries:
+        assert cache.load(user.pk) == user
+    assert len(queries) == 0
+    user.delete()
+    assert cache.get(user.pk) is None
@@ -0,0 +1,60 @@
+import json
+import os
+import time
+
+from django.test import override_settings
+from googleapiclient.http import HttpMockSequence
+
+from jasonpi import discovery, metrics
+from jasonpi.serializers import ProviderSerializer
+
+DOCUMENT = discovery.bundled_document()
+
+
+def test_service_is_built_once(mocker):
+    """Test that the service is built once and its build time recorded."""
+    discovery.reset_service()
+    metrics.reset()
+    fetch = mocker.patch.object(discovery, 'fetch_document')
+    service = discovery.get_service()
+    assert discovery.get_service() is service
+    assert not fetch.called
+    timing = metrics.snapshot()['timings']['jasonpi.google.discovery.build']
+    assert timing['count'] == 1
+
+
+def test_disk_cache_refresh(mocker, tmp_path):
+    """Test that the disk cache is downloaded only when stale."""
+    path = str(tmp_path / 'people.json')
+    fetch = mocker.patch.object(
+        discovery, 'fetch_document', return_value=DOCUMENT)
+    with override_settings(
+        JASONPI_GOOGLE_DISCOVERY_CACHE=path,
+        JASONPI_GOOGLE_DISCOVERY_TTL=60,
+    ):
+        assert discovery.load_document() == DOCUMENT
+        assert discovery.load_document() == DOCUMENT
+        assert fetch.call_count == 1
+        os.utime(path, (time.time() - 120, time.time() - 120))
+        fetch.side_effect = IOError
+        assert discovery.load_document() == DOCUMENT
+        assert fetch.call_count == 2
+
+
+def test_validate_google_uses_shared_service(mocker):
+    """Test that requests execute the shared service with their own http."""
+    discovery.reset_service()
+    build = mocker.spy(discovery, 'build_from_document')
+    user = {
+        'resourceName': 'people/42',
+        'emailAddresses': [{'value': 'some@email.com'}],
+        'names': [{'givenName': 'Alfred', 'familyName': 'Dupont'}],
+        'genders': [{'value': 'male'}],
+    }
+    for _ in range(2):
+        mocker.patch('jasonpi.serializers.httplib2.Http', return_value=(
+            HttpMockSequence([({'status': '200'}, json.dumps(user))])
+        ))
+        profile = ProviderSerializer().validate_google('token', '42')
+        assert profile['email'] == 'some@email.com'
+    assert build.call_count == 1
@@ -0,0 +1,67 @@
+import io
+
+import pytest
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+
+from jasonpi.views import AuthSignInView
+
+User = get_user_model()
+factory = APIRequestFactory()
+
+
+def test_canonical_email_is_maintained(db):
+    user = User.objects.create_user('Some.One@Email.com', 'password')
+    assert user.email == 'Some.One@email.com'
+    assert user.email_canonical == 'some.one@email.com'
+    user.email = 'Other@Email.com'
+    user.save(update_fields=['email'])
+    user.refresh_from_db()
+    assert user.email_canonical == 'other@email.com'
+
+
+def test_get_by_email(db):
+    """Test that lookups ignore case with a single query."""
+    user = User.objects.create_user('some@email.com', 'password')
+    with CaptureQueriesContext(connection) as queries:
+        assert User.objects.get_by_email('SOME@email.COM') == user
+    assert len(queries) == 1
+    twin = User.objects.create_user('Some@email.com', 'password')
+    assert User.objects.get_by_email('Some@email.com') == twin
+    assert User.objects.get_by_email('some@email.com') == user
+    with pytest.raises(User.DoesNotExist):
+        User.objects.get_by_email('SOME@email.com')
+    with pytest.raises(User.DoesNotExist):
+        User.objects.get_by_email(None)
+
+
+def test_sign_in_ignores_email_case(db):
+    User.objects.create_user('some@email.com', 'password')
+    request = factory.post(
+        '/auth/signin',
+        {'email': 'Some@Email.com', 'password': 'password'},
+        format='json',
+    )
+    assert AuthSignInView.as_view()(request).status_code == 200
+
+
+def test_backfill_canonical_emails(db):
+    """Test that users saved before the column existed are backfilled."""
+    for i in range(5):
+        User.objects.create_user('User%d@email.com' % i)
+    User.objects.update(email_canonical=None)
+    assert User.objects.get_by_email('User3@email.com').pk
+    with pytest.raises(User.DoesNotExist):
+        User.objects.get_by_email('user3@email.com')
+    call_command(
+        'jasonpi_backfill_canonical_emails',
+        batch_size=2,
+        stdout=io.StringIO(),
+    )
+    assert not User.objects.filter(email_canonical=None).exists()
+    assert User.objects.get_by_email('user3@email.com').email == \
+        'User3@email.com'
@@ -0,0 +1,127 @@
+import threading
+import time
+from io import StringIO
+
+import pytest
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import override_settings
+
+from jasonpi import hashing, metrics
+from jasonpi.management.commands.jasonpi_benchmark_hashers import Command
+
+User = get_user_model()
+
+
+@pytest.fixture
+def pool():
+    with override_settings(
+        JASONPI_HASHER_WORKERS=1,
+        JASONPI_HASHER_QUEUE_SIZE=0,
+    ):
+        yield hashing.get_pool()
+
+
+def test_pool_hashes_and_checks_passwords(pool):
+    """Test that passwords set and checked in the pool match."""
+    user = User(email='some@email.com')
+    hashing.set_password(user, 'password')
+    assert user.password.startswith('md5$')
+    assert hashing.check_password(user, 'password')
+    assert not hashing.check_password(user, 'wrong')
+    assert metrics.snapshot()['timings']['jasonpi.hashing.latency']['count']
+
+
+def test_pool_rejects_work_when_full(pool):
+    """Test that a full pool answers immediately with a 503."""
+    thread = threading.Thread(target=pool.run, args=(time.sleep, 0.5))
+    thread.start()
+    time.sleep(0.1)
+    start = time.perf_counter()
+    with pytest.raises(hashing.HashingUnavailable):
+        hashing.check_password(User(password='md5$salt$hash'), 'password')
+    assert time.perf_counter() - start < 0.1
+    assert metrics.snapshot()['gauges']['jasonpi.hashing.queue_depth'] == 0
+    thread.join()
+    assert pool.in_flight == 0
+
+
+def test_inline_hashing_without_workers():
+    """Test that hashing runs on the request thread by default."""
+    assert hashing.get_pool() is None
+    user = User(email='some@email.com')
+    hashing.set_password(user, 'password')
+    assert hashing.check_password(user, 'password')
+
+
+@pytest.mark.parametrize('workers', [0, 1])
+def test_check_password_rehashes_to_target(db, workers):
+    """Test that a successful sign in upgrades an outdated hash."""
+    user = User.objects.create_user('some@email.com', 'password')
+    assert user.password.startswith('md5$')
+    with override_settings(
+        JASONPI_HASHER_WORKERS=workers,
+        PASSWORD_HASHERS=[
+            'testapp.hashers.FastPBKDF2PasswordHasher',
+            'django.contrib.auth.hashers.MD5PasswordHasher',
+        ],
+    ):
+        assert hashing.needs_rehash(user.password)
+        assert not hashing.check_password(user, 'wrong')
+        assert user.password.startswith('md5$')
+        assert hashing.check_password(user, 'password')
+        user.refresh_from_db()
+        assert user.password.startswith('pbkdf2_sha256$10$')
+        assert not hashing.needs_rehash(user.password)
+
+
+def test_check_password_skips_rehash_when_full(db, mocker):
+    """Test that a full pool doesn't fail a sign in with a valid password."""
+    user = User.objects.create_user('some@email.com', 'password')
+    with override_settings(
+        JASONPI_HASHER_WORKERS=1,
+        PASSWORD_HASHERS=[
+            'testapp.hashers.FastPBKDF2PasswordHasher',
+            'django.contrib.auth.hashers.MD5PasswordHasher',
+        ],
+    ):
+        # the check passes, then the pool is full for the rehash
+        mocker.patch.object(
+            hashing.get_pool(),
+            'run',
+            side_effect=[True, hashing.HashingUnavailable()],
+        )
+        assert hashing.check_password(user, 'password')
+        assert user.password.startswith('md5$')
+        user.refresh_from_db()
+        assert user.password.startswith('md5$')
+
+
+def test_benchmark_hashers_command():
+    """Test that every configured hasher is reported."""
+    out = StringIO()
+    with override_settings(PASSWORD_HASHERS=[
+        'testapp.hashers.FastPBKDF2PasswordHasher',
+        'django.contrib.auth.hashers.MD5PasswordHasher',
+    ]):
+        call_command(
+            'jasonpi_benchmark_hashers',
+            duration=0.01,
+            target=100,
+            stdout=out,
+        )
+    lines = out.getvalue().splitlines()
+    assert lines[1].startswith('*pbkdf2_sha256')
+    assert 'iterations=' in lines[1]
+    assert lines[2].startswith(' md5')
+
+
+def test_benchmark_hashers_suggestions():
+    """Test that bcrypt rounds are scaled on a log2 scale."""
+    command = Command()
+    assert command.suggest('iterations', 1000, 4) == 4000
+    assert command.suggest('time_cost', 2, 0.5) == 1
+    assert command.suggest('rounds', 12, 4) == 14
+    assert command.suggest('rounds', 12, 0.5) == 11
+    assert command.suggest('rounds', 12, 1e-9) == 4
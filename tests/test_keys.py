@@ -0,0 +1,120 @@
+import pytest
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory
+
+import jwt
+
+from jasonpi.auth import JWTAuthentication, decode_token, get_token
+from jasonpi.keys import Key, Keyring, get_keyring
+from jasonpi.views import jwks
+
+User = get_user_model()
+
+
+def pem_pair(private_key):
+    private = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    ).decode('utf-8')
+    public = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo,
+    ).decode('utf-8')
+    return private, public
+
+
+RSA_PRIVATE, RSA_PUBLIC = pem_pair(
+    rsa.generate_private_key(public_exponent=65537, key_size=2048))
+OLD_PRIVATE, OLD_PUBLIC = pem_pair(
+    rsa.generate_private_key(public_exponent=65537, key_size=2048))
+ED_PRIVATE, ED_PUBLIC = pem_pair(ed25519.Ed25519PrivateKey.generate())
+
+KEYS = [
+    {
+        'kid': 'new',
+        'algorithm': 'RS256',
+        'private_key': RSA_PRIVATE,
+        'public_key': RSA_PUBLIC,
+    },
+    {'kid': 'old', 'algorithm': 'RS256', 'public_key': OLD_PUBLIC},
+    {'kid': 'ed', 'algorithm': 'EdDSA', 'public_key': ED_PUBLIC},
+]
+
+
+def test_default_keyring_uses_secret_key(db):
+    """Test that tokens are signed with HS256 and no kid by default."""
+    user = User.objects.create_user('some@email.com')
+    token = get_token(user)
+    assert jwt.get_unverified_header(token) == {
+        'alg': 'HS256',
+        'typ': 'JWT',
+    }
+    assert get_keyring().jwks() == {'keys': []}
+
+
+@override_settings(JASONPI_JWT_KEYS=KEYS)
+def test_rotated_keys(db):
+    """Test that the active key signs and retired keys still verify."""
+    user = User.objects.create_user('some@email.com')
+    token = get_token(user)
+    assert jwt.get_unverified_header(token)['kid'] == 'new'
+    assert decode_token(token)['user_id'] == user.pk
+
+    old = Keyring([Key('RS256', kid='old', private_key=OLD_PRIVATE)])
+    assert decode_token(old.sign({'user_id': 1}))['user_id'] == 1
+    ed = Keyring([Key('EdDSA', kid='ed', private_key=ED_PRIVATE)])
+    assert decode_token(ed.sign({'user_id': 2}))['user_id'] == 2
+
+
+def test_verify_only_keyring(db):
+    """Test that a keyring of public keys verifies but can't sign."""
+    user = User.objects.create_user('some@email.com')
+    with override_settings(JASONPI_JWT_KEYS=KEYS):
+        token = get_token(user)
+    with override_settings(JASONPI_JWT_KEYS=[
+        {'kid': 'new', 'algorithm': 'RS256', 'public_key': RSA_PUBLIC},
+    ]):
+        request = APIRequestFactory().get(
+            '/', HTTP_AUTHORIZATION='Bearer %s' % token)
+        assert JWTAuthentication().authenticate(request)[0] == user
+        with pytest.raises(ImproperlyConfigured):
+            get_token(user)
+
+
+@override_settings(JASONPI_JWT_KEYS=KEYS)
+def test_unknown_or_forged_keys_are_rejected():
+    """Test that tokens of other keys or without kid are refused."""
+    other = Keyring([Key('RS256', kid='old', private_key=RSA_PRIVATE)])
+    with pytest.raises(jwt.InvalidSignatureError):
+        decode_token(other.sign({'user_id': 1}))
+    unknown = Keyring([Key('RS256', kid='unknown', private_key=RSA_PRIVATE)])
+    with pytest.raises(jwt.InvalidTokenError):
+        decode_token(unknown.sign({'user_id': 1}))
+    hmac = jwt.encode(
+        {'user_id': 1},
+        'a-secret-long-enough-for-an-hs256-signature',
+        algorithm='HS256',
+        headers={'kid': 'new'},
+    )
+    with pytest.raises(jwt.InvalidAlgorithmError):
+        decode_token(hmac)
+    with pytest.raises(jwt.InvalidTokenError):
+        decode_token(jwt.encode({'user_id': 1}, None, algorithm='none'))
+
+
+@override_settings(JASONPI_JWT_KEYS=KEYS)
+def test_jwks_endpoint():
+    """Test that the public keys are published."""
+    response = jwks(APIRequestFactory().get('/auth/jwks'))
+    keys = {key['kid']: key for key in response.data['keys']}
+    assert set(keys) == {'new', 'old', 'ed'}
+    assert keys['new']['kty'] == 'RSA' and keys['new']['alg'] == 'RS256'
+    assert keys['ed']['kty'] == 'OKP'
+    assert 'd' not in keys['new']
+    assert response['Cache-Control'] == 'public, max-age=3600'
@@ -0,0 +1,56 @@
+import datetime
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from jasonpi.last_login import LastLoginTracker
+
+User = get_user_model()
+
+MINUTE = datetime.timedelta(minutes=1)
+
+
+def test_touch_writes_only_last_login(db):
+    """Test that a sign in updates last_login and nothing else."""
+    user = User.objects.create_user('some@email.com')
+    updated_at = user.updated_at
+    tracker = LastLoginTracker(granularity=5 * MINUTE)
+    with CaptureQueriesContext(connection) as queries:
+        assert tracker.touch(user)
+    assert len(queries) == 1
+    assert 'updated_at' not in queries[0]['sql']
+    user.refresh_from_db()
+    assert user.last_login is not None
+    assert user.updated_at == updated_at
+
+
+def test_touch_skips_recent_logins(db):
+    """Test that sign ins within the granularity are not written."""
+    user = User.objects.create_user('some@email.com')
+    tracker = LastLoginTracker(granularity=5 * MINUTE)
+    now = timezone.now()
+    tracker.touch(user, now)
+    with CaptureQueriesContext(connection) as queries:
+        assert not tracker.touch(user, now + 4 * MINUTE)
+    assert len(queries) == 0
+    assert tracker.touch(user, now + 6 * MINUTE)
+    assert (tracker.writes, tracker.skipped) == (2, 1)
+
+
+def test_flush_batches_pending_logins(db):
+    """Test that queued sign ins are written by a single flush."""
+    users = [
+        User.objects.create_user('user%d@email.com' % i) for i in range(3)
+    ]
+    tracker = LastLoginTracker(granularity=MINUTE, flush_interval=3600)
+    tracker.start = lambda: None
+    now = timezone.now()
+    with CaptureQueriesContext(connection) as queries:
+        for user in users:
+            tracker.touch(user, now)
+    assert len(queries) == 0
+    assert tracker.flush() == 3
+    assert User.objects.filter(last_login=now).count() == 3
+    assert tracker.flush() == 0
@@ -0,0 +1,71 @@
+import pytest
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import viewsets
+from rest_framework.test import APIRequestFactory
+from rest_framework_json_api import pagination, renderers
+
+from jasonpi.models import Provider
+from jasonpi.views import PrefetchForIncludesMixin
+from testapp.serializers import UserSerializer
+
+User = get_user_model()
+factory = APIRequestFactory()
+
+
+class PublicUserSerializer(UserSerializer):
+    class Meta(UserSerializer.Meta):
+        limited_fields = ('url', 'first_name', 'providers', 'groups')
+
+
+class PublicUserViewSet(PrefetchForIncludesMixin, viewsets.ModelViewSet):
+    queryset = User.objects.all()
+    serializer_class = PublicUserSerializer
+    renderer_classes = (renderers.JSONRenderer, )
+    pagination_class = pagination.JsonApiPageNumberPagination
+    resource_name = 'users'
+
+
+def list_users(size, include=None):
+    """Render a page of users and return its queries."""
+    params = {'page[size]': size}
+    if include is not None:
+        params['include'] = include
+    request = factory.get('/users', params)
+    view = PublicUserViewSet.as_view({'get': 'list'})
+    with CaptureQueriesContext(connection) as queries:
+        response = view(request)
+        response.render()
+    assert response.status_code == 200
+    assert len(response.data['results']) == size
+    return len(queries)
+
+
+@pytest.fixture
+def users(db):
+    group = Group.objects.create(name='group')
+    for i in range(10):
+        user = User.objects.create_user('user%d@email.com' % i)
+        user.groups.add(group)
+        Provider.objects.create(user=user, provider='google', uid=str(i))
+
+
+@pytest.mark.parametrize('include', [None, 'providers', 'providers,groups'])
+def test_list_query_count_is_constant(users, include):
+    """Test that relationships and includes don't query per user."""
+    assert list_users(2, include) == list_users(10, include)
+
+
+def test_retrieve_prefetches_relationships(users):
+    user = User.objects.first()
+    request = factory.get('/users/%d' % user.pk, {'include': 'providers'})
+    request.user = user
+    view = PublicUserViewSet.as_view({'get': 'retrieve'})
+    response = view(request, pk=user.pk)
+    response.render()
+    assert response.status_code == 200
+    assert response.data['providers'] == [
+        {'type': 'Provider', 'id': str(user.providers.get().pk)}]
@@ -0,0 +1,169 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from django.test import override_settings
+from rest_framework import exceptions
+
+from jasonpi import providers
+from jasonpi.serializers import ProviderSerializer
+
+GOOGLE_USER = {
+    'resourceName': 'people/42',
+    'emailAddresses': [{'value': 'some@email.com'}],
+    'names': [{'givenName': 'Alfred', 'familyName': 'Dupont'}],
+    'genders': [{'value': 'male'}],
+}
+
+FACEBOOK_USER = {
+    'id': '43',
+    'email': 'some@email.com',
+    'first_name': 'Alfred',
+    'last_name': 'Dupont',
+    'birthday': '02/25/1970',
+}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answer like the google and facebook apis for the 'good' token."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            server.connections.add(self.client_address)
+        time.sleep(server.delay)
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == '/google':
+            valid = self.headers.get('Authorization') == 'Bearer good'
+            data = GOOGLE_USER
+        else:
+            valid = query.get('access_token') == ['good']
+            data = FACEBOOK_USER
+        body = json.dumps(data if valid else {'error': 'invalid'}).encode()
+        self.send_response(200 if valid else 401)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with server.lock:
+            server.in_flight -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.lock = threading.Lock()
+    server.in_flight = server.max_in_flight = 0
+    server.connections = set()
+    server.delay = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = 'http://127.0.0.1:%d' % server.server_address[1]
+    with override_settings(
+        JASONPI_ASYNC_PROVIDERS=True,
+        JASONPI_PROVIDERS={
+            'google': {'url': url + '/google', 'concurrency': 2},
+            'facebook': {'url': url + '/facebook', 'timeout': 0.2},
+        },
+    ):
+        yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_verify_google(stub):
+    """Test that the google profile is fetched and normalized."""
+    profile = providers.verify('google', 'good', '42')
+    assert profile['email'] == 'some@email.com'
+    assert profile['first_name'] == 'Alfred'
+    with pytest.raises(exceptions.ValidationError):
+        providers.verify('google', 'good', '41')
+    with pytest.raises(exceptions.ValidationError):
+        providers.verify('google', 'bad', '42')
+
+
+def test_verify_facebook(stub):
+    """Test that the facebook profile is fetched and normalized."""
+    profile = providers.verify('facebook', 'good', '43')
+    assert profile['last_name'] == 'Dupont'
+    with pytest.raises(exceptions.ValidationError):
+        providers.verify('facebook', 'bad', '43')
+    with pytest.raises(exceptions.ValidationError):
+        providers.verify('twitter', 'good', '43')
+
+
+def test_verify_all_is_bounded_and_pooled(stub):
+    """Test that verifications run concurrently within the provider limit."""
+    stub.delay = 0.1
+    start = time.perf_counter()
+    results = providers.verify_all([('google', 'good', '42')] * 6)
+    elapsed = time.perf_counter() - start
+    assert all(r['email'] == 'some@email.com' for r in results)
+    assert stub.max_in_flight == 2
+    assert elapsed < 0.5
+    assert len(stub.connections) == 2
+
+
+def test_verify_timeout(stub):
+    """Test that a slow provider answers with a 503."""
+    stub.delay = 0.5
+    with pytest.raises(providers.ProviderUnavailable):
+        providers.verify('facebook', 'good', '43')
+
+
+def test_slot_is_held_until_the_request_is_over(mocker):
+    """Test that the concurrency limit counts requests still running."""
+    client = providers.FacebookClient('http://127.0.0.1:1', 0.1, 1)
+    release = threading.Event()
+    mocker.patch.object(
+        client, 'fetch',
+        side_effect=lambda token: release.wait() and FACEBOOK_USER)
+    thread = threading.Thread(target=client.verify, args=('good', '43'))
+    thread.start()
+    with pytest.raises(providers.ProviderUnavailable):
+        client.verify('good', '43')
+    release.set()
+    thread.join()
+
+
+def test_serializer_uses_async_layer(stub):
+    """Test that ProviderSerializer verifies through the provider clients."""
+    serializer = ProviderSerializer()
+    assert serializer.validate_google('good', '42')['gender'] == 'male'
+    assert serializer.validate_facebook('good', '43')['first_name'] == \
+        'Alfred'
+
+
+def test_verified_profiles_are_cached(mocker):
+    """Test that a retried access token is verified once."""
+    validate = mocker.patch.object(
+        ProviderSerializer,
+        'validate_facebook',
+        return_value={'email': 'some@email.com'},
+    )
+    serializer = ProviderSerializer()
+    with override_settings(JASONPI_PROVIDER_CACHE_TTL=60):
+        for _ in range(3):
+            profile = serializer.verify('facebook', 'good', '43')
+            assert profile == {'email': 'some@email.com'}
+        assert validate.call_count == 1
+        serializer.verify('facebook', 'other', '43')
+        serializer.verify('facebook', 'good', '44')
+        assert validate.call_count == 3
+        serializer.verify('facebook', 'expired', '43', expires_in=0)
+        serializer.verify('facebook', 'expired', '43', expires_in=0)
+        assert validate.call_count == 5
+    serializer.verify('facebook', 'good', '43')
+    assert validate.call_count == 6
@@ -0,0 +1,89 @@
+import datetime
+import json
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+
+from jasonpi.auth import decode_token
+from jasonpi.models import RefreshToken
+from jasonpi.refresh import issue_refresh_token
+from jasonpi.views import AuthRefreshView, AuthSignInView, signout
+
+User = get_user_model()
+factory = APIRequestFactory()
+
+
+def refresh(token):
+    request = factory.post(
+        '/auth/refresh',
+        {'refresh_token': token},
+        format='json',
+    )
+    return AuthRefreshView.as_view()(request)
+
+
+@override_settings(JASONPI_REFRESH_TOKENS=True)
+def test_sign_in_issues_refresh_token(db):
+    """Test that a sign in returns a refresh token in meta and cookie."""
+    User.objects.create_user('some@email.com', 'password')
+    request = factory.post(
+        '/auth/signin',
+        {'email': 'some@email.com', 'password': 'password'},
+        format='json',
+    )
+    response = AuthSignInView.as_view()(request)
+    response.render()
+    token = json.loads(response.content)['meta']['refresh_token']
+    assert response.cookies['refresh_token'].value == token
+    assert RefreshToken.objects.get().token_hash != token
+
+
+def test_refresh_rotates_tokens(db):
+    """Test that a refresh costs one lookup and rotates the token."""
+    user = User.objects.create_user('some@email.com')
+    token = issue_refresh_token(user)
+    with CaptureQueriesContext(connection) as queries:
+        response = refresh(token)
+    assert response.status_code == 200
+    assert len(queries) == 3
+    assert decode_token(response.data['access_token'])['user_id'] == user.pk
+    assert response.data['refresh_token'] != token
+    assert response.cookies['refresh_token'].value == \
+        response.data['refresh_token']
+    assert refresh(response.data['refresh_token']).status_code == 200
+
+
+def test_refresh_token_reuse_revokes_family(db):
+    """Test that replaying a used token revokes its successors."""
+    user = User.objects.create_user('some@email.com')
+    token = issue_refresh_token(user)
+    other = issue_refresh_token(user)
+    rotated = refresh(token).data['refresh_token']
+    assert refresh(token).status_code == 401
+    assert refresh(rotated).status_code == 401
+    assert refresh(other).status_code == 200
+
+
+def test_invalid_refresh_tokens(db):
+    """Test that unknown, expired and missing tokens are refused."""
+    user = User.objects.create_user('some@email.com')
+    token = issue_refresh_token(user)
+    RefreshToken.objects.update(
+        expires_at=timezone.now() - datetime.timedelta(seconds=1))
+    assert refresh(token).status_code == 401
+    assert refresh('unknown').status_code == 401
+    assert refresh(None).status_code == 401
+
+
+def test_signout_revokes_refresh_token(db):
+    user = User.objects.create_user('some@email.com')
+    token = issue_refresh_token(user)
+    request = factory.get('/auth/signout')
+    request.COOKIES['refresh_token'] = token
+    response = signout(request)
+    assert response.cookies['refresh_token'].value == ''
+    assert refresh(token).status_code == 401
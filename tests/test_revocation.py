@@ -0,0 +1,158 @@
+import datetime
+import time
+
+import pytest
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.test import APIRequestFactory
+
+from jasonpi.auth import \
+    JWTAuthentication, \
+    decode_token, \
+    get_token, \
+    revoke_user_tokens
+from jasonpi.models import RevokedToken
+from jasonpi.refresh import issue_refresh_token, rotate_refresh_token
+from jasonpi.revocation import get_revocation_list
+from jasonpi.views import signout
+
+User = get_user_model()
+factory = APIRequestFactory()
+
+
+def authenticate(token):
+    request = factory.get('/', HTTP_AUTHORIZATION='Bearer %s' % token)
+    return JWTAuthentication().authenticate(request)
+
+
+@override_settings(
+    JASONPI_TOKEN_REVOCATION=True,
+    JASONPI_STATELESS_TOKEN=True,
+)
+def test_revoked_token_is_refused_without_query(db):
+    """Test that revocations are checked in memory."""
+    user = User.objects.create_user('some@email.com', 'password')
+    token, other = get_token(user), get_token(user)
+    authenticate(token)
+    request = factory.get('/', HTTP_AUTHORIZATION='Bearer %s' % token)
+    assert signout(request).status_code == 204
+    with CaptureQueriesContext(connection) as queries:
+        with pytest.raises(exceptions.AuthenticationFailed):
+            authenticate(token)
+        assert authenticate(other)[0].pk == user.pk
+    assert len(queries) == 0
+
+
+@override_settings(JASONPI_TOKEN_REVOCATION=True)
+def test_revoke_user_tokens(db):
+    """Test that a watermark revokes the tokens issued before it."""
+    user = User.objects.create_user('some@email.com', 'password')
+    other = User.objects.create_user('other@email.com', 'password')
+    token, other_token = get_token(user), get_token(other)
+    revoke_user_tokens(user)
+    with pytest.raises(exceptions.AuthenticationFailed):
+        authenticate(token)
+    assert authenticate(get_token(user))[0] == user
+    assert authenticate(other_token)[0] == other
+
+
+@override_settings(JASONPI_TOKEN_REVOCATION=True)
+def test_revoke_user_tokens_revokes_refresh_tokens(db):
+    """Test that refresh tokens issued before a watermark are refused."""
+    user = User.objects.create_user('some@email.com', 'password')
+    other = User.objects.create_user('other@email.com', 'password')
+    token, other_token = issue_refresh_token(user), issue_refresh_token(other)
+    revoke_user_tokens(user)
+    with pytest.raises(exceptions.AuthenticationFailed):
+        rotate_refresh_token(token)
+    assert rotate_refresh_token(issue_refresh_token(user))[0] == user
+    assert rotate_refresh_token(other_token)[0] == other
+
+
+@override_settings(
+    JASONPI_TOKEN_REVOCATION=True,
+    JASONPI_TOKEN_REVOCATION_SYNC_INTERVAL=0,
+)
+def test_revocations_are_synced(db):
+    """Test that revocations of other processes are fetched."""
+    user = User.objects.create_user('some@email.com', 'password')
+    token = get_token(user)
+    authenticate(token)
+    payload = decode_token(token)
+    RevokedToken.objects.create(
+        jti=payload['jti'],
+        expires_at=timezone.now() + datetime.timedelta(days=1),
+    )
+    time.sleep(0.01)
+    with pytest.raises(exceptions.AuthenticationFailed):
+        authenticate(token)
+
+
+@override_settings(
+    JASONPI_TOKEN_REVOCATION=True,
+    JASONPI_TOKEN_REVOCATION_SYNC_INTERVAL=0,
+)
+def test_revocations_committed_late_are_synced(db):
+    """Test that a row committed after a newer one was synced is fetched."""
+    revocation_list = get_revocation_list()
+    revocation_list.is_revoked({'jti': 'none'})
+    expires_at = timezone.now() + datetime.timedelta(days=1)
+    # created first, committed after the next row was synced
+    late = RevokedToken(pk=50, jti='late', expires_at=expires_at)
+    RevokedToken.objects.create(pk=51, jti='first', expires_at=expires_at)
+    time.sleep(0.01)
+    assert revocation_list.is_revoked({'jti': 'first'})
+    late.save()
+    time.sleep(0.01)
+    assert revocation_list.is_revoked({'jti': 'late'})
+
+
+@override_settings(
+    JASONPI_TOKEN_REVOCATION=True,
+    JASONPI_TOKEN_REVOCATION_SYNC_INTERVAL=0,
+)
+def test_sync_does_not_block_checks(db):
+    """Test that checks use the current list while another thread syncs."""
+    revocation_list = get_revocation_list()
+    revocation_list.is_revoked({'jti': 'none'})
+    expires_at = timezone.now() + datetime.timedelta(days=1)
+    RevokedToken.objects.create(jti='synced', expires_at=expires_at)
+    # a sync claimed by another thread, which copied the list
+    revocation_list.syncing = True
+    jtis = dict(revocation_list.jtis)
+    with CaptureQueriesContext(connection) as queries:
+        assert not revocation_list.is_revoked({'jti': 'synced'})
+    assert len(queries) == 0
+    # revoked here while the sync runs, kept once the sync swaps the list
+    revocation_list.revoke({'jti': 'local', 'exp': expires_at.timestamp()})
+    revocation_list.update(time.monotonic(), False, jtis, {})
+    assert revocation_list.is_revoked({'jti': 'synced'})
+    assert revocation_list.is_revoked({'jti': 'local'})
+    assert not revocation_list.syncing
+
+
+@override_settings(JASONPI_TOKEN_REVOCATION=True)
+def test_expired_revocations_are_dropped(db):
+    """Test that revocations are forgotten once their tokens expire."""
+    now = timezone.now()
+    RevokedToken.objects.create(
+        jti='expired',
+        expires_at=now - datetime.timedelta(seconds=1),
+    )
+    RevokedToken.objects.create(
+        jti='live',
+        expires_at=now + datetime.timedelta(days=1),
+    )
+    revocation_list = get_revocation_list()
+    assert revocation_list.is_revoked({'jti': 'live'})
+    assert not revocation_list.is_revoked({'jti': 'expired'})
+    assert list(RevokedToken.objects.values_list('jti', flat=True)) == \
+        ['live']
+    revocation_list.jtis['live'] = time.time() - 1
+    revocation_list.prune(time.time())
+    assert revocation_list.jtis == {}
@@ -0,0 +1,303 @@
+import base64
+import hashlib
+import hmac
+import json
+import threading
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+import requests
+
+from django.contrib.auth import get_user_model
+from django.test import override_settings
+from rest_framework import exceptions
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from moto import mock_aws
+
+from jasonpi import s3
+from jasonpi.views import \
+    s3_abort_multipart_upload, \
+    s3_complete_multipart_upload, \
+    s3_create_multipart_upload, \
+    s3_get_presigned_post, \
+    s3_get_presigned_url, \
+    s3_get_presigned_urls, \
+    s3_presign_multipart_parts, \
+    s3_sign_policy_document
+
+User = get_user_model()
+factory = APIRequestFactory()
+
+
+@pytest.fixture
+def bucket(monkeypatch):
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    s3.reset_client()
+    with mock_aws(), override_settings(BUCKET='bucket'):
+        s3.get_client().create_bucket(Bucket='bucket')
+        yield 'bucket'
+    s3.reset_client()
+
+
+def test_presigned_url(db, bucket):
+    user = User.objects.create_user('some@email.com')
+    request = factory.get(
+        '/auth/s3',
+        {'objectName': 'picture.png', 'contentType': 'image/png'},
+    )
+    force_authenticate(request, user)
+    response = s3_get_presigned_url(request)
+    assert response.status_code == 200
+    url = urlparse(response.data['signedUrl'])
+    assert url.path.startswith('/u%d/misc/' % user.pk)
+    assert any(name.endswith('Signature') for name in parse_qs(url.query))
+
+
+def test_presigned_url_requires_object_name(db, bucket):
+    request = factory.get('/auth/s3')
+    force_authenticate(request, User.objects.create_user('some@email.com'))
+    assert s3_get_presigned_url(request).status_code == 400
+
+
+def test_validate_key():
+    key = 'u42/assets/2018-01-24_3f2b-4c.png'
+    assert s3.validate_key(key, 42).group('category') == 'assets'
+    assert s3.validate_key(key[1:], 42)
+    for key, user_id in (
+        (key, 4),
+        (key, None),
+        ('u42/other/2018-01-24_3f2b.png', 42),
+        ('u42/misc/today.png', 42),
+    ):
+        with pytest.raises(exceptions.ValidationError):
+            s3.validate_key(key, user_id)
+
+
+def test_client_is_shared(bucket):
+    clients = []
+    threads = [
+        threading.Thread(target=lambda: clients.append(s3.get_client()))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(client) for client in clients}) == 1
+
+
+def test_client_max_age(bucket):
+    client = s3.get_client()
+    with override_settings(JASONPI_S3_CLIENT_MAX_AGE=0):
+        assert s3.get_client() is not client
+    assert s3.get_client() is s3.get_client()
+
+
+def presign_batch(user, files):
+    request = factory.post('/auth/s3/batch', {'files': files}, format='json')
+    force_authenticate(request, user)
+    return s3_get_presigned_urls(request)
+
+
+def test_batch_presigned_urls(db, bucket):
+    user = User.objects.create_user('some@email.com')
+    files = [
+        {'objectName': 'picture%d.png' % i, 'contentType': 'image/png'}
+        for i in range(20)
+    ]
+    response = presign_batch(user, files)
+    assert response.status_code == 200
+    signed_urls = response.data['signedUrls']
+    assert [f['objectName'] for f in signed_urls] == \
+        [f['objectName'] for f in files]
+    assert len({f['key'] for f in signed_urls}) == 20
+    for f in signed_urls:
+        assert f['key'].startswith('u%d/misc/' % user.pk)
+        assert f['key'] in f['signedUrl']
+
+
+@override_settings(JASONPI_S3_BATCH_LIMIT=2)
+def test_batch_presigned_urls_limits(db, bucket):
+    user = User.objects.create_user('some@email.com')
+    files = [{'objectName': 'a.png'}] * 3
+    assert presign_batch(user, files).status_code == 400
+    assert presign_batch(user, files[:2]).status_code == 200
+    assert presign_batch(user, []).status_code == 400
+    assert presign_batch(user, [{'contentType': 'image/png'}]) \
+        .status_code == 400
+
+
+def post(view, user, data):
+    request = factory.post('/auth/s3/multipart', data, format='json')
+    force_authenticate(request, user)
+    return view(request)
+
+
+def test_multipart_upload(db, bucket):
+    """Test a multipart upload through presigned part urls."""
+    user = User.objects.create_user('some@email.com')
+    response = post(s3_create_multipart_upload, user, {
+        'objectName': 'video.mp4',
+        'contentType': 'video/mp4',
+    })
+    upload = {
+        'key': response.data['key'],
+        'uploadId': response.data['uploadId'],
+    }
+    response = post(s3_presign_multipart_parts, user, dict(
+        upload, firstPart=1, lastPart=2))
+    urls = [part['signedUrl'] for part in response.data['parts']]
+    assert [part['partNumber'] for part in response.data['parts']] == [1, 2]
+    chunks = [b'a' * 5 * 1024 * 1024, b'b']
+    etags = [
+        requests.put(url, data=chunk).headers['ETag']
+        for url, chunk in zip(urls, chunks)
+    ]
+    response = post(s3_complete_multipart_upload, user, dict(upload, parts=[
+        {'partNumber': number, 'etag': etag}
+        for number, etag in enumerate(etags, 1)
+    ]))
+    assert response.status_code == 200
+    body = s3.get_client().get_object(Bucket=bucket, Key=upload['key'])
+    assert body['Body'].read() == b''.join(chunks)
+
+
+def test_multipart_upload_checks(db, bucket):
+    user = User.objects.create_user('some@email.com')
+    other = User.objects.create_user('other@email.com')
+    upload = dict(
+        post(s3_create_multipart_upload, user, {'objectName': 'a.mp4'}).data)
+    assert post(s3_presign_multipart_parts, other, upload).status_code == 400
+    with override_settings(JASONPI_S3_MULTIPART_PARTS_LIMIT=10):
+        assert post(s3_presign_multipart_parts, user, dict(
+            upload, firstPart=1, lastPart=11)).status_code == 400
+    assert post(s3_presign_multipart_parts, user, dict(
+        upload, firstPart=0)).status_code == 400
+    assert post(s3_complete_multipart_upload, user, dict(
+        upload, parts=[{'partNumber': 1, 'etag': '"x"'}])).status_code == 400
+    assert post(s3_complete_multipart_upload, user, dict(
+        upload, parts='all')).status_code == 400
+    assert post(s3_abort_multipart_upload, user, upload).status_code == 204
+
+
+def presign_post(user, **params):
+    request = factory.get('/auth/s3/post', params)
+    force_authenticate(request, user)
+    return s3_get_presigned_post(request)
+
+
+@override_settings(JASONPI_S3_UPLOAD_LIMITS={'misc': {'max_size': 1024}})
+def test_presigned_post(db, bucket):
+    """Test that the policy carries the limits of the key category."""
+    user = User.objects.create_user('some@email.com')
+    response = presign_post(
+        user, objectName='notes.txt', contentType='text/plain')
+    assert response.status_code == 200
+    fields = response.data['fields']
+    assert fields['key'] == response.data['key']
+    policy = json.loads(base64.b64decode(fields['policy']))
+    conditions = policy['conditions']
+    assert ['content-length-range', 1, 1024] in conditions
+    assert ['starts-with', '$Content-Type', ''] in conditions
+    assert {'key': response.data['key']} in conditions
+    upload = requests.post(
+        response.data['url'],
+        data=fields,
+        files={'file': ('notes.txt', b'notes')},
+    )
+    assert upload.status_code in (200, 204)
+    body = s3.get_client().get_object(Bucket=bucket, Key=fields['key'])
+    assert body['Body'].read() == b'notes'
+
+
+def test_presigned_post_content_type(db, bucket, monkeypatch):
+    user = User.objects.create_user('some@email.com')
+    monkeypatch.setattr(
+        'jasonpi.views.s3_key_getter',
+        lambda request, ext: 'u%d/assets/2018-01-24_a.%s' % (user.pk, ext),
+    )
+    assert presign_post(user, objectName='a.png').status_code == 400
+    assert presign_post(
+        user, objectName='a.exe', contentType='application/x-msdownload',
+    ).status_code == 400
+    response = presign_post(user, objectName='a.png', contentType='image/png')
+    policy = json.loads(base64.b64decode(response.data['fields']['policy']))
+    assert ['starts-with', '$Content-Type', 'image/'] in policy['conditions']
+    assert ['content-length-range', 1, 10 * 1024 * 1024] in \
+        policy['conditions']
+
+
+SECRET = 'wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY'
+
+
+def test_signer_v4_signing_key():
+    """Test the signing key against the example of the AWS documentation."""
+    signer = s3.S3Signer(SECRET)
+    key = signer.signing_key(('20120215', 'us-east-1', 'iam'))
+    assert key.hex() == \
+        'f4780e2d9f65fa895f9c67b32ce1baf0b0d8a43505a000a1a9e090d414db404d'
+    assert signer.signing_key(('20120215', 'us-east-1', 'iam')) is key
+    for day in range(10, 30):
+        signer.signing_key(('201202%d' % day, 'us-east-1', 's3'))
+    assert len(signer.signing_keys) == signer.max_signing_keys
+
+
+def test_signer_headers():
+    signer = s3.S3Signer(SECRET)
+    v2 = 'PUT\n\nvideo/mp4\n\nx-amz-date:Wed, 24 Jan 2018 10:00:00 GMT'
+    assert signer.sign_headers(v2)['signature'] == base64.b64encode(
+        hmac.new(SECRET.encode(), v2.encode(), hashlib.sha1).digest(),
+    ).decode()
+    v4 = '\n'.join([
+        'AWS4-HMAC-SHA256',
+        '20180124T100000Z',
+        '20180124/eu-west-1/s3/aws4_request',
+        'canonical-request-hash',
+    ])
+    key = signer.signing_key(('20180124', 'eu-west-1', 's3'))
+    assert signer.sign_headers(v4)['signature'] == \
+        hmac.new(key, v4.encode(), hashlib.sha256).hexdigest()
+    with pytest.raises(ValueError):
+        signer.sign_headers('AWS4-HMAC-SHA256\n20180124T100000Z')
+
+
+def sign(payload):
+    request = factory.post('/auth/s3/signature', payload, format='json')
+    return s3_sign_policy_document(request)
+
+
+def test_sign_policy_document(monkeypatch):
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', SECRET)
+    s3.reset_signer()
+    policy_document = {
+        'expiration': '2018-01-24T12:00:00.000Z',
+        'conditions': [
+            {'bucket': 'bucket'},
+            {'x-amz-algorithm': 'AWS4-HMAC-SHA256'},
+            {'x-amz-credential': 'AKID/20180124/eu-west-1/s3/aws4_request'},
+        ],
+    }
+    response = sign(policy_document)
+    policy = response.data['policy'].encode()
+    key = s3.get_signer().signing_key(('20180124', 'eu-west-1', 's3'))
+    assert response.data['signature'] == \
+        hmac.new(key, policy, hashlib.sha256).hexdigest()
+    policy_document['conditions'] = policy_document['conditions'][:1]
+    response = sign(policy_document)
+    assert response.data['signature'] == base64.b64encode(hmac.new(
+        SECRET.encode(),
+        response.data['policy'].encode(),
+        hashlib.sha1,
+    ).digest()).decode()
+    signer = s3.get_signer()
+    assert s3.get_signer() is signer
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'rotated')
+    assert s3.get_signer() is signer
+    s3.reset_signer()
+    assert s3.get_signer().secret == b'rotated'
+    policy_document['conditions'].append(
+        {'x-amz-algorithm': 'AWS4-HMAC-SHA256'})
+    assert sign(policy_document).status_code == 400
@@ -0,0 +1,157 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.paginator import Paginator
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.serializers import ModelSerializer
+from rest_framework.test import APIRequestFactory
+
+from jasonpi.models import Provider
+from jasonpi.serializers import ProviderSerializer
+from testapp.serializers import UserSerializer
+
+User = get_user_model()
+
+PROFILE = {
+    'email': 'some@email.com',
+    'first_name': 'Alfred',
+    'last_name': 'Dupont',
+}
+
+
+@pytest.fixture
+def google(mocker):
+    return mocker.patch.object(
+        ProviderSerializer,
+        'validate_google',
+        side_effect=lambda *args: dict(PROFILE),
+    )
+
+
+def provider_login(user=None):
+    """Validate and save a google login, return the user and the queries."""
+    request = Request(APIRequestFactory().post('/auth/provider'))
+    request.user = user or AnonymousUser()
+    serializer = ProviderSerializer(
+        data={'uid': '42', 'provider': 'google', 'access_token': 'token'},
+        context={'request': request},
+    )
+    with CaptureQueriesContext(connection) as context:
+        serializer.is_valid(raise_exception=True)
+        serializer.save(last_login=datetime.now(timezone.utc))
+    queries = [
+        q['sql'] for q in context.captured_queries
+        if 'SAVEPOINT' not in q['sql']
+    ]
+    return serializer.instance, queries
+
+
+def test_provider_login_new_user(db, google):
+    """Test that a first login looks up and writes everything once."""
+    user, queries = provider_login()
+    assert len(queries) == 4
+    assert user.email == PROFILE['email']
+    assert user.last_login is not None
+    assert Provider.objects.get(uid='42').user == user
+
+
+def test_provider_login_existing_user(db, google):
+    """Test that a known account is loaded with its user in one query."""
+    user = User.objects.create_user('some@email.com')
+    Provider.objects.create(user=user, uid='42', provider='google')
+    logged, queries = provider_login()
+    assert len(queries) == 2
+    assert queries[0].count('SELECT') == 1
+    assert logged == user
+    assert logged.last_login is not None
+
+
+def test_provider_login_email_user(db, google):
+    """Test that a provider is linked to the user owning its email."""
+    user = User.objects.create_user('some@email.com')
+    logged, queries = provider_login()
+    assert len(queries) == 4
+    assert logged == user
+    assert logged.first_name == 'Alfred'
+
+
+def test_provider_link_account(db, google):
+    """Test that an authenticated user links a provider."""
+    user = User.objects.create_user('some@email.com')
+    logged, queries = provider_login(user)
+    assert len(queries) == 3
+    assert logged == user
+    assert user.providers.get().uid == '42'
+
+
+def test_provider_link_account_of_another_user(db, google):
+    """Test that a provider linked to another user can't be linked."""
+    other = User.objects.create_user('other@email.com')
+    Provider.objects.create(user=other, uid='42', provider='google')
+    with pytest.raises(exceptions.ValidationError):
+        provider_login(User.objects.create_user('some@email.com'))
+
+
+def test_provider_login_race(db, google):
+    """Test that a login losing the race uses the winner's account."""
+    request = Request(APIRequestFactory().post('/auth/provider'))
+    request.user = AnonymousUser()
+    serializer = ProviderSerializer(
+        data={'uid': '42', 'provider': 'google', 'access_token': 'token'},
+        context={'request': request},
+    )
+    serializer.is_valid(raise_exception=True)
+    winner = User.objects.create_user('winner@email.com')
+    Provider.objects.create(user=winner, uid='42', provider='google')
+    serializer.save()
+    assert serializer.instance == winner
+    assert not User.objects.filter(email=PROFILE['email']).exists()
+
+
+def user_fields(instance, user=None, **kwargs):
+    context = {}
+    if user is not None:
+        request = Request(APIRequestFactory().get('/users'))
+        request.user = user
+        context['request'] = request
+    serializer = UserSerializer(instance, context=context, **kwargs)
+    if kwargs.get('many'):
+        serializer = serializer.child
+    return set(serializer.fields)
+
+
+def test_user_serializer_limited_fields(db):
+    """Test that collections and other users only expose limited fields."""
+    user = User.objects.create_user('some@email.com', 'password')
+    other = User.objects.create_user('other@email.com', 'password')
+    full = {
+        'url', 'email', 'first_name', 'last_name', 'password',
+        'old_password', 'providers', 'groups',
+    }
+    limited = {'url', 'first_name', 'last_name'}
+    assert user_fields(user, user) == full
+    assert user_fields(user) == full
+    assert user_fields(None) == full
+    assert user_fields(other, user) == limited
+    assert user_fields([user], user) == limited
+    assert user_fields(User.objects.all(), many=True) == limited
+    page = Paginator(User.objects.all(), 1).page(1)
+    assert user_fields(page, many=True) == limited
+    assert user_fields(User.objects.all(), user, many=True) == limited
+
+
+def test_user_serializer_field_names_cached(db, mocker):
+    user = User.objects.create_user('some@email.com', 'password')
+    user_fields(user)
+    get_field_names = mocker.spy(ModelSerializer, 'get_field_names')
+    user_fields(user)
+    user_fields([user])
+    assert get_field_names.call_count == 0
+    assert list(UserSerializer._fields[True]) == \
+        ['url', 'first_name', 'last_name']
@@ -0,0 +1,97 @@
+import threading
+import time
+
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory
+
+from jasonpi.throttling import IPThrottle, parse_rate
+from jasonpi.views import AuthSignInView
+
+
+def test_parse_rate():
+    assert parse_rate('5/min') == (5, 60)
+    assert parse_rate('100/hour') == (100, 3600)
+    assert parse_rate('1/s') == (1, 1)
+
+
+def test_bucket_refills_lazily(mocker):
+    """Test that tokens come back at the rate of the bucket."""
+    cache.clear()
+    now = mocker.patch('jasonpi.throttling.time.time', return_value=1000.0)
+    throttle = IPThrottle()
+    assert all(throttle.consume('key', 3, 60) for _ in range(3))
+    assert not throttle.consume('key', 3, 60)
+    assert throttle.wait() == 20
+    now.return_value += 20
+    assert throttle.consume('key', 3, 60)
+    assert not throttle.consume('key', 3, 60)
+    now.return_value += 3600
+    assert all(throttle.consume('key', 3, 60) for _ in range(3))
+    assert not throttle.consume('key', 3, 60)
+
+
+def test_bucket_is_one_cache_key():
+    """Test that a bucket's storage doesn't grow with its requests."""
+    cache.clear()
+    throttle = IPThrottle()
+    assert all(throttle.consume('key', 1000, 3600) for _ in range(500))
+    assert len(cache._cache) == 1
+
+
+def test_bucket_is_shared_by_concurrent_requests(mocker):
+    """Test that concurrent requests never take more than the capacity."""
+    cache.clear()
+    get = LocMemCache.get
+
+    def slow_get(*args, **kwargs):
+        # every request reads the bucket before any of them writes it
+        value = get(*args, **kwargs)
+        time.sleep(0.002)
+        return value
+
+    mocker.patch.object(LocMemCache, 'get', slow_get)
+    barrier = threading.Barrier(20)
+    results = []
+
+    def request():
+        barrier.wait()
+        results.append(IPThrottle().consume('key', 5, 60))
+
+    threads = [threading.Thread(target=request) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results.count(True) == 5
+
+
+def sign_in(email, ip='10.0.0.1'):
+    request = APIRequestFactory().post(
+        '/auth/signin',
+        {'email': email, 'password': 'password'},
+        format='json',
+        REMOTE_ADDR=ip,
+    )
+    return AuthSignInView.as_view()(request).status_code
+
+
+@override_settings(JASONPI_THROTTLE_RATES={
+    'signin_ip': '4/min',
+    'signin_account': '2/min',
+})
+def test_sign_in_throttles(db):
+    """Test that sign ins are limited by account and by ip."""
+    cache.clear()
+    assert sign_in('some@email.com') == 400
+    assert sign_in('Some@email.com') == 400
+    assert sign_in('some@email.com') == 429
+    assert sign_in('other@email.com') == 400
+    assert sign_in('another@email.com') == 429
+    assert sign_in('another@email.com', ip='10.0.0.2') == 400
+
+
+def test_sign_in_is_not_throttled_by_default(db):
+    cache.clear()
+    assert all(sign_in('some@email.com') == 400 for _ in range(10))
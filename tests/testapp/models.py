@@ -0,0 +1,5 @@
+from jasonpi.base import BaseUser
+
+
+class User(BaseUser):
+    pass
@@ -0,0 +1,16 @@
+from jasonpi.serializers import UserSerializer as JPIUserSerializer
+
+
+class UserSerializer(JPIUserSerializer):
+    class Meta(JPIUserSerializer.Meta):
+        fields = (
+            'url',
+            'email',
+            'first_name',
+            'last_name',
+            'password',
+            'old_password',
+            'providers',
+            'groups',
+        )
+        limited_fields = ('url', 'first_name', 'last_name')
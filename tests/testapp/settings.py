@@ -0,0 +1,38 @@
+"""Minimal django settings used by the test suite and the benchmarks."""
+
+SECRET_KEY = 'jasonpi-tests-secret-key-for-hs256-signatures'
+
+DEBUG = True
+
+ALLOWED_HOSTS = ['testserver']
+
+INSTALLED_APPS = [
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'rest_framework',
+    'jasonpi',
+    'testapp',
+]
+
+AUTH_USER_MODEL = 'testapp.User'
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': ':memory:',
+    },
+}
+
+ROOT_URLCONF = 'testapp.urls'
+
+USER_SERIALIZER = 'testapp.serializers.UserSerializer'
+
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+]
+
+USE_TZ = True
+
+REST_FRAMEWORK = {
+    'EXCEPTION_HANDLER': 'jasonpi.auth.custom_exception_handler',
+}
@@ -0,0 +1,24 @@
+from django.conf.urls import include, url
+from rest_framework import routers
+
+from testapp import views
+
+router = routers.SimpleRouter()
+router.register(r'users', views.UserViewSet, basename='user')
+router.register(r'providers', views.ProviderViewSet, basename='provider')
+router.register(r'groups', views.GroupViewSet, basename='group')
+
+urlpatterns = [
+    url(r'^', include('jasonpi.urls')),
+    url(r'^', include(router.urls)),
+    url(
+        r'^users/(?P<user_pk>[^/.]+)/providers$',
+        views.UserViewSet.as_view({'get': 'list'}),
+        name='user-providers-list',
+    ),
+    url(
+        r'^users/(?P<user_pk>[^/.]+)/groups$',
+        views.UserViewSet.as_view({'get': 'list'}),
+        name='user-groups-list',
+    ),
+]
@@ -0,0 +1,24 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from rest_framework import viewsets
+
+from jasonpi.models import Provider
+from jasonpi.serializers import GroupSerializer, ProviderSerializer
+from jasonpi.views import PrefetchForIncludesMixin
+from testapp.serializers import UserSerializer
+
+
+class UserViewSet(PrefetchForIncludesMixin, viewsets.ModelViewSet):
+    queryset = get_user_model().objects.all()
+    serializer_class = UserSerializer
+    resource_name = 'users'
+
+
+class ProviderViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = Provider.objects.all()
+    serializer_class = ProviderSerializer
+
+
+class GroupViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = Group.objects.all()
+    serializer_class = GroupSerializer